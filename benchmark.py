@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+
+# TDi Loadbank Controller benchmarks
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Times the loadbank client and one pass of the main loop against the
+# simulator (started in its own process) or a real loadbank, eg:
+#     python3 benchmark.py --samples 1000 --latency 0.002 --json results.json
+
+# Import libraries
+import argparse, json, os, platform, socket, subprocess, sys, time
+import loadbank, main, datalogger
+
+
+## Inspect user input arguments
+def _parse_commandline():
+    # Define the parser
+    parser = argparse.ArgumentParser(description='TDi Loadbank Controller benchmarks')
+
+    # Define aguments
+    parser.add_argument('--samples', type=int, default=500, help='Iterations per benchmark')
+    parser.add_argument('--host', type=str, default='', help='Real loadbank, blank to simulate')
+    parser.add_argument('--port', type=int, default=10001, help='Real loadbank port')
+    parser.add_argument('--password', type=str, default='fuelcell', help='Loadbank password')
+    parser.add_argument('--latency', type=float, default=0.001, help='Simulated reply latency')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Simulated reply jitter')
+    parser.add_argument('--drop', type=float, default=0.0, help='Simulated dropped replies')
+    parser.add_argument('--garbage', type=float, default=0.0, help='Simulated garbage bytes')
+    parser.add_argument('--json', type=str, default='', help='Save the results to this file')
+
+    # Return what was argued
+    return parser.parse_args()
+
+
+## Function to start the simulator in its own process so it isn't timed
+def _start_simulator(args):
+    # Find a free port
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    # Start the simulator
+    process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simulator.py'),
+                                '--port', str(port), '--password', args.password,
+                                '--latency', str(args.latency), '--jitter', str(args.jitter),
+                                '--drop', str(args.drop), '--garbage', str(args.garbage)],
+                               stdout=subprocess.DEVNULL)
+
+    # Wait for it to listen
+    for attempt in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise SystemExit("Simulator failed to start")
+
+
+## Function to time a function over many samples
+def _measure(name, function, samples, load):
+    # Warm up
+    for n in range(min(10, samples)):
+        function()
+
+    resends = load.resends
+    latencies = []
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    for n in range(samples):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    # Work out the statistics
+    latencies.sort()
+    result = {
+        "name":        name,
+        "samples":     samples,
+        "p50_ms":      1000 * latencies[int(0.50 * (samples - 1))],
+        "p99_ms":      1000 * latencies[int(0.99 * (samples - 1))],
+        "max_ms":      1000 * latencies[-1],
+        "rate_hz":     samples / wall,
+        "resends":     load.resends - resends,
+        "cpu_ms":      1000 * cpu / samples,
+    }
+
+    # Print the results
+    print("{name:8s} p50 {p50_ms:8.3f}ms  p99 {p99_ms:8.3f}ms  max {max_ms:8.3f}ms  "
+          "{rate_hz:8.1f}/s  resends {resends:4d}  cpu {cpu_ms:6.3f}ms".format(**result))
+    return result
+
+
+## Function to run one pass of the main loop without the user interface
+def _loop(load, log, timeStart):
+    try:
+        load.update()
+    except loadbank.LoadbankError as error:
+        print("Loadbank: " + str(error))
+    log.write(main._get_time(timeStart) + main._get_electric(load))
+
+
+## Main run function
+if __name__ == "__main__":
+    args = _parse_commandline()
+
+    # Connect to a real loadbank or the simulator
+    process = None
+    if args.host:
+        host, port = args.host, args.port
+    else:
+        process, port = _start_simulator(args)
+        host = '127.0.0.1'
+
+    try:
+        load = loadbank.TdiLoadbank(host, port, args.password)
+        if not load.connect():
+            raise SystemExit
+        load.mode = "CURRENT"
+        load.current_constant = "1.0"
+        log = datalogger.Datalogger(os.devnull)
+        timeStart = time.time()
+
+        # Run each benchmark
+        results = [
+            _measure("update", load.update, args.samples, load),
+            _measure("get", lambda: load._get(load._tn, "v"), args.samples, load),
+            # Forced so each is a real write rather than suppressed as unchanged
+            _measure("set", lambda: load._set(load._tn, "ci", "1.0", force=True), args.samples, load),
+            _measure("loop", lambda: _loop(load, log, timeStart), args.samples, load),
+        ]
+
+        # Save the results for comparing between versions
+        if args.json:
+            with open(args.json, 'w') as fid:
+                json.dump({
+                    "time":     time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "python":   platform.python_version(),
+                    "platform": platform.platform(),
+                    "device":   args.host or "simulator",
+                    "settings": vars(args),
+                    "results":  results,
+                }, fid, indent=2)
+            print("Saved to " + args.json)
+
+        log.close()
+        load._tn.close()
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+# Binary logfile format for the TDi Loadbank Controller
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# File layout, all little endian:
+#     8 bytes   magic b'TDILOG\x00\x01'
+#     uint32    length of the JSON header that follows
+#     JSON      {"start": epoch, "channels": [names]}
+#     records   float64 epoch then one float32 per channel, packed
+#
+# Read it with numpy, memory mapped so it loads instantly:
+#     data = binlog.load("180101-120000-controller-test.bin")
+#     data["current"].mean()
+#
+# Or convert it back to the Matlab compatible tsv:
+#     python3 binlog.py 180101-120000-controller-test.bin > test.tsv
+
+# Import libraries
+import json, mmap, struct, sys
+
+
+# File identifier, the last byte is the format version
+MAGIC = b'TDILOG\x00\x01'
+
+# Channels logged by main.py after the time
+CHANNELS = ["mode", "setpoint", "voltage", "current", "power", "watt_hours", "amp_hours"]
+
+# Function to make the record layout for some channels
+def _record_struct(channels):
+    return struct.Struct('<d' + 'f' * len(channels))
+
+
+# Function to turn a logged cell into a number
+def _to_number(cell):
+    try:
+        return float(cell)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+# Binary format for datalogger.Datalogger
+class BinaryFormat():
+    binary = True
+
+    # Code to run when class is created
+    def __init__(self, start, channels=CHANNELS):
+        self.__start = start
+        self.__channels = list(channels)
+        self.__record = _record_struct(self.__channels)
+
+    # Method to make the start of the file
+    def header(self):
+        header = json.dumps({"start": self.__start, "channels": self.__channels}).encode('utf-8')
+        return MAGIC + struct.pack('<I', len(header)) + header
+
+    # Method to turn records into bytes
+    # Records are [epoch, duration, channels...], duration is left out as it is epoch - start
+    def encode(self, records):
+        pack = self.__record.pack
+        return b''.join(pack(record[0], *map(_to_number, record[2:])) for record in records)
+
+
+# Function to read the header, returns [header dict, offset of the first record]
+def read_header(fid):
+    if fid.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a binary loadbank log")
+    length, = struct.unpack('<I', fid.read(4))
+    header = json.loads(fid.read(length).decode('utf-8'))
+    return header, len(MAGIC) + 4 + length
+
+
+# Function to memory map a log as a numpy record array
+def load(filename):
+    import numpy  # Only needed to read logs
+
+    with open(filename, 'rb') as fid:
+        header, offset = read_header(fid)
+    dtype = numpy.dtype([("time", '<f8')] + [(name, '<f4') for name in header["channels"]])
+    return numpy.memmap(filename, dtype=dtype, mode='r', offset=offset)
+
+
+# Function to read a log without numpy, yields [epoch, channels...] per record
+def records(filename):
+    with open(filename, 'rb') as fid:
+        header, offset = read_header(fid)
+        record = _record_struct(header["channels"])
+        with mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            end = offset + (len(data) - offset) // record.size * record.size
+            for position in range(offset, end, record.size):
+                yield record.unpack_from(data, position)
+
+
+# Function to write a channel value as main.py does, float32 keeps about 7 significant figures
+def _to_cell(value):
+    cell = "{0:.7g}".format(value)
+    return cell + ".0" if cell.lstrip('-').isdigit() else cell  # 30.0 not 30, like str(float)
+
+
+# Function to write a log as the Matlab compatible tsv main.py writes
+def to_tsv(filename, destination):
+    with open(filename, 'rb') as fid:
+        start = read_header(fid)[0]["start"]
+    for values in records(filename):
+        epoch, mode = values[0], values[1]
+        cells = [str(epoch), str(epoch - start)]
+        if mode in (1, 2, 3):
+            cells += [str(int(mode)), _to_cell(values[2])]
+        else:
+            cells += ["999", "999"]  # No mode, see main._get_electric
+        cells += [_to_cell(value) for value in values[3:]]
+        destination.write('\t'.join(cells) + '\t\n')
+
+
+## Main run function
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python3 binlog.py logfile.bin [logfile.tsv]")
+        raise SystemExit
+
+    if len(sys.argv) == 3:
+        with open(sys.argv[2], 'w') as out:
+            to_tsv(sys.argv[1], out)
+    else:
+        to_tsv(sys.argv[1], sys.stdout)
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+
+# Command console for the TDi Loadbank Controller
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Typed in lines are read on their own thread and queued as commands, the
+# control loop takes whatever is ready between ticks so typing never holds it up:
+#     console = Console()
+#     console.start()
+#     for command in console.ready():
+#         ...
+
+# Import libraries
+import collections, queue, sys, threading
+
+
+# One command, eg. "v 1.5" is Command("v", "1.5", None)
+# reply(result, error) is called once it has run if the command came from somewhere other than the screen
+# claim is an optional lock, whoever takes it first either runs the command or gives up on it
+Command = collections.namedtuple("Command", "name argument reply claim", defaults=(None,))
+
+
+# Function to turn a typed in line into a command, None if it is blank
+def parse(line, reply=None):
+    words = line.lower().split()
+    if not words:
+        return None
+    return Command(words[0], words[1] if len(words) > 1 else None, reply)
+
+
+# Define class
+class Console():
+    # Code to run when class is created, size is the most commands allowed to wait
+    def __init__(self, stream=sys.stdin, size=100):
+        self.__stream = stream
+        self.__queue = queue.Queue(size)
+        self.__thread = None
+        self.dropped = 0  # Count of commands thrown away as too many were waiting
+
+    # Method to start reading in the background
+    def start(self):
+        self.__thread = threading.Thread(target=self._run, name="console", daemon=True)
+        self.__thread.start()
+
+    # Method to read lines until the stream ends, from the background thread
+    def _run(self):
+        for line in self.__stream:
+            command = parse(line)
+            if command:
+                self.submit(command)
+
+    # Method to queue a command from anywhere, False if too many are waiting
+    def submit(self, command):
+        try:
+            self.__queue.put_nowait(command)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    # Method to take every command that is ready without waiting
+    def ready(self):
+        commands = []
+        while True:
+            try:
+                commands.append(self.__queue.get_nowait())
+            except queue.Empty:
+                return commands
+
+    # Property - How many commands are waiting?
+    @property
+    def depth(self):
+        return self.__queue.qsize()
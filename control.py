@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+
+# Network control server for the TDi Loadbank Controller
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# JSON-RPC 2.0, one request per line, over TCP or a Unix socket, eg:
+#     python3 main.py --control-port 10002
+#     echo '{"jsonrpc": "2.0", "id": 1, "method": "set_current", "params": {"value": 2.0}}' | nc -q1 localhost 10002
+#
+# Settings are queued onto the control loop like typed in commands and answered
+# once the loop has run them. One the loop hasn't started within the timeout is
+# never run, so an error always means nothing changed. Queries are answered
+# straight away from the last sample the loop took, so they never add traffic
+# to the Loadbank.
+#
+# Methods:
+#     set_current   {"value": amps}
+#     set_voltage   {"value": volts}, the voltage to hold if not in voltage mode
+#     set_load      {"on": true|false}
+#     set_auto      {"on": true|false}
+#     set_profile   {"state": "on"|"pause"|"off"}
+#     reset_energy  start the energy and charge counters from zero
+#     command       {"text": "stats?"}, any console command
+#     get_sample    the last sample, a dict
+#     get_time, get_mode, get_setpoint, get_voltage, get_current, get_power
+#     get_watt_hours, get_amp_hours
+
+# Import libraries
+import json, os, socketserver, threading
+import console
+
+
+# JSON-RPC error codes
+PARSE_ERROR      = -32700
+INVALID_REQUEST  = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS   = -32602
+COMMAND_FAILED   = -32000
+
+
+# Error to answer a request with
+class RpcError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+# Functions to turn a setting request into a console command
+def _number(params):
+    try:
+        return str(float(params["value"]))
+    except (KeyError, TypeError, ValueError):
+        raise RpcError(INVALID_PARAMS, "Expected {\"value\": number}")
+
+
+def _on_off(params):
+    if not isinstance(params.get("on"), bool):
+        raise RpcError(INVALID_PARAMS, "Expected {\"on\": true|false}")
+    return "on" if params["on"] else "off"
+
+
+def _profile_state(params):
+    if params.get("state") not in ("on", "pause", "off"):
+        raise RpcError(INVALID_PARAMS, "Expected {\"state\": \"on\"|\"pause\"|\"off\"}")
+    return params["state"]
+
+
+# Settings, method: [console command, function(params) giving its argument]
+_SETTINGS = {
+    "set_current":  ["i",       _number],
+    "set_voltage":  ["v",       _number],
+    "set_load":     ["load",    _on_off],
+    "set_auto":     ["auto",    _on_off],
+    "set_profile":  ["profile", _profile_state],
+    "reset_energy": ["energy",  lambda params: "reset"],
+}
+
+# Queries answered from the last sample, method: sample key, None for all of it
+_QUERIES = {
+    "get_sample":     None,
+    "get_time":       "time",
+    "get_mode":       "mode",
+    "get_setpoint":   "setpoint",
+    "get_voltage":    "voltage",
+    "get_current":    "current",
+    "get_power":      "power",
+    "get_watt_hours": "watt_hours",
+    "get_amp_hours":  "amp_hours",
+}
+
+
+# Define class
+class _Handler(socketserver.StreamRequestHandler):
+    # Method to answer requests until the client leaves
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.answer(line)
+            if response is not None:
+                self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+                self.wfile.flush()
+
+
+# Define class
+class _Control():
+    # Method to keep what the servers need
+    # submit queues a console.Command onto the control loop, sample returns the last sample dict
+    def _setup(self, submit, sample, timeout):
+        self.__submit = submit
+        self.__sample = sample
+        self.__timeout = timeout  # Seconds to wait for the control loop
+        self.__thread = None
+        self.requests = 0  # Count of requests answered
+
+    # Method to answer one request line, returns the response or None for a notification
+    def answer(self, line):
+        request_id = None
+        try:
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                raise RpcError(PARSE_ERROR, "Parse error")
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                raise RpcError(INVALID_REQUEST, "Invalid request")
+            request_id = request.get("id")
+            params = request.get("params") or {}
+            if not isinstance(params, dict):
+                raise RpcError(INVALID_PARAMS, "Params must be an object")
+
+            result = self._call(request["method"], params)
+            response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+        except RpcError as error:
+            response = {"jsonrpc": "2.0", "id": request_id,
+                        "error": {"code": error.code, "message": str(error)}}
+
+        self.requests += 1
+        return response if request_id is not None or "error" in response else None
+
+    # Method to run a method
+    def _call(self, method, params):
+        if method in _QUERIES:
+            sample = self.__sample()
+            return sample if _QUERIES[method] is None else sample.get(_QUERIES[method])
+        elif method in _SETTINGS:
+            name, argument = _SETTINGS[method]
+            return self._run(console.Command(name, argument(params), None))
+        elif method == "command":
+            command = console.parse(str(params.get("text", "")))
+            if command is None:
+                raise RpcError(INVALID_PARAMS, "Expected {\"text\": console command}")
+            return self._run(command)
+        raise RpcError(METHOD_NOT_FOUND, "Unknown method '" + method + "'")
+
+    # Method to run a command on the control loop and wait for its answer
+    def _run(self, command):
+        done = threading.Event()
+        answer = []
+
+        # Called by the control loop once the command has run
+        def reply(result, error=None):
+            answer.append((result, error))
+            done.set()
+
+        claim = threading.Lock()
+        if not self.__submit(command._replace(reply=reply, claim=claim)):
+            raise RpcError(COMMAND_FAILED, "Too many commands waiting")
+        if not done.wait(self.__timeout):
+            # Give up on it unless the control loop has already started running it
+            if claim.acquire(False):
+                raise RpcError(COMMAND_FAILED, "Control loop did not answer in time, the command was not run")
+            done.wait()
+        result, error = answer[0]
+        if error:
+            raise RpcError(COMMAND_FAILED, error)
+        return result
+
+    # Method to serve in the background
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, name="control", daemon=True)
+        self.__thread.start()
+        return self.server_address
+
+    # Method to stop serving
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        return 1
+
+
+# Define class
+class ControlServer(_Control, socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    # Code to run when class is created, localhost only by default
+    def __init__(self, submit, sample, HOST='127.0.0.1', PORT=10002, timeout=5.0):
+        self._setup(submit, sample, timeout)
+        socketserver.ThreadingTCPServer.__init__(self, (HOST, PORT), _Handler)
+
+
+# Define class
+class UnixControlServer(_Control, socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    # Code to run when class is created, an old socket file at path is replaced
+    def __init__(self, submit, sample, path, timeout=5.0):
+        self._setup(submit, sample, timeout)
+        if os.path.exists(path):
+            os.remove(path)
+        socketserver.ThreadingUnixStreamServer.__init__(self, path, _Handler)
+
+    # Method to stop serving and remove the socket file
+    def stop(self):
+        _Control.stop(self)
+        os.remove(self.server_address)
+        return 1
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+# Background datalogger for the TDi Loadbank Controller
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Import libraries
+import collections, threading, time
+
+
+# What to do with a new record when the queue is full
+DROP_NEWEST = "drop-newest"  # Throw away the new record
+DROP_OLDEST = "drop-oldest"  # Throw away the oldest waiting record
+BLOCK       = "block"        # Wait for space, the control loop will stall
+
+
+# Tab separated text format, Matlab compatible
+class TsvFormat():
+    binary = False
+
+    # Method to make the start of the file
+    def header(self):
+        return ''
+
+    # Method to turn records into lines of the logfile
+    def encode(self, records):
+        return ''.join(self._format(record) for record in records)
+
+    # Method to turn a record into a line of the logfile, numbers at full precision
+    @staticmethod
+    def _format(record):
+        return ''.join(str(cell) + '\t' for cell in record) + '\n'
+
+
+# Define class
+class Datalogger():
+    # Code to run when class is created, fmt defaults to TsvFormat
+    def __init__(self, filename, size=1000, policy=DROP_OLDEST, batch=100, flush_period=1.0, late=1.0, fmt=None):
+        if policy not in (DROP_NEWEST, DROP_OLDEST, BLOCK):
+            raise ValueError("Unknown overflow policy " + str(policy))
+
+        # Open the logfile
+        self.__format = fmt or TsvFormat()
+        self.__fid = open(filename, 'wb' if self.__format.binary else 'w')
+        self.__fid.write(self.__format.header())
+
+        # Define internal variables
+        self.__size = size  # Most records allowed to wait
+        self.__policy = policy
+        self.__batch = batch  # Most records written in one go
+        self.__flush_period = flush_period  # Seconds between flushes to disk
+        self.__late = late  # Seconds a record can wait before it counts as late
+        self.__queue = collections.deque()
+        self.__condition = threading.Condition()
+        self.__running = True
+        self.__dropped = 0
+        self.__late_count = 0
+        self.__written = 0
+
+        # Start writing in the background
+        self.__thread = threading.Thread(target=self._run, name="datalogger", daemon=True)
+        self.__thread.start()
+
+    # Method to log one record, a list of cells, never blocks unless policy is BLOCK
+    def write(self, record):
+        with self.__condition:
+            if not self.__running:
+                return 0
+
+            # Apply the overflow policy if the queue is full
+            if len(self.__queue) >= self.__size:
+                if self.__policy == DROP_NEWEST:
+                    self.__dropped += 1
+                    return 0
+                elif self.__policy == DROP_OLDEST:
+                    self.__queue.popleft()
+                    self.__dropped += 1
+                else:
+                    while len(self.__queue) >= self.__size and self.__running:
+                        self.__condition.wait()
+
+            # Queue the record with the time it was made
+            self.__queue.append((time.monotonic(), record))
+            self.__condition.notify_all()
+        return 1
+
+    # Method to write records from the background thread
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            # Wait for something to write
+            with self.__condition:
+                while not self.__queue and self.__running:
+                    self.__condition.wait(self.__flush_period)
+                    if time.monotonic() - last_flush >= self.__flush_period:
+                        break
+                batch = [self.__queue.popleft() for n in range(min(self.__batch, len(self.__queue)))]
+                running = self.__running
+                self.__condition.notify_all()
+
+            # Write the batch in one go
+            if batch:
+                now = time.monotonic()
+                self.__late_count += sum(1 for made, record in batch if now - made > self.__late)
+                self.__fid.write(self.__format.encode([record for made, record in batch]))
+                self.__written += len(batch)
+
+            # Flush to disk every so often
+            if time.monotonic() - last_flush >= self.__flush_period:
+                self.__fid.flush()
+                last_flush = time.monotonic()
+
+            # Finish once everything has been written
+            if not running and not batch:
+                return
+
+    # Method to write everything left and close the logfile
+    def close(self):
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
+        self.__thread.join()
+        self.__fid.close()
+        return 1
+
+    # Property - How many records are waiting to be written?
+    @property
+    def depth(self):
+        return len(self.__queue)
+
+    # Property - How many records were thrown away?
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    # Property - How many records waited too long to be written?
+    @property
+    def late(self):
+        return self.__late_count
+
+    # Property - How many records have been written?
+    @property
+    def written(self):
+        return self.__written
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+
+# Energy and charge counters for the TDi Loadbank Controller
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Adds up the energy and charge taken as each sample arrives, using the
+# trapezium rule between samples, so the totals are live rather than worked
+# out from the logfile afterwards:
+#     counter = energy.Energy()
+#     counter.add(time.monotonic(), load.current, load.power)
+#     counter.watt_hours, counter.amp_hours
+#
+# Timestamps are monotonic seconds, so pausing the profile or changing the
+# clock makes no difference. Call interrupt() when samples stop, eg. the link
+# is lost, and nothing is guessed for the gap.
+
+
+# Define class
+class Energy():
+    # Code to run when class is created
+    def __init__(self):
+        self.reset()
+
+    # Method to start counting from zero
+    def reset(self):
+        self.__last = None  # [time, current, power] of the last sample
+        self.__joules = 0.0
+        self.__coulombs = 0.0
+        self.__seconds = 0.0  # Time counted over
+        self.gaps = 0  # Count of interruptions left out of the totals
+
+    # Method to add a sample, anything that isn't a number is left out
+    def add(self, stamp, current, power):
+        try:
+            current, power = float(current), float(power)
+        except (TypeError, ValueError):
+            self.interrupt()
+            return
+
+        if self.__last is not None and stamp > self.__last[0]:
+            elapsed = stamp - self.__last[0]
+            self.__coulombs += 0.5 * (current + self.__last[1]) * elapsed
+            self.__joules += 0.5 * (power + self.__last[2]) * elapsed
+            self.__seconds += elapsed
+        self.__last = [stamp, current, power]
+
+    # Method to start again from the next sample without counting the time in between
+    def interrupt(self):
+        if self.__last is not None:
+            self.gaps += 1
+        self.__last = None
+
+    # Property - Energy taken in Wh
+    @property
+    def watt_hours(self):
+        return self.__joules / 3600.0
+
+    # Property - Charge taken in Ah
+    @property
+    def amp_hours(self):
+        return self.__coulombs / 3600.0
+
+    # Property - Seconds counted over
+    @property
+    def seconds(self):
+        return self.__seconds
+
+    # Method to describe the totals
+    def __str__(self):
+        return "{0:.4f}Wh {1:.4f}Ah over {2:.1f}s, {3} gaps left out".format(
+            self.watt_hours, self.amp_hours, self.__seconds, self.gaps)
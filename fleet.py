@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+# Fleet of TDi Loadbanks driven from one controller
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# For rigs scripted in Python, main.py still drives a single Loadbank:
+#     rig = fleet.Fleet({"stack1": loadbank.TdiLoadbank("10.0.0.1", 10001, "fuelcell"),
+#                        "stack2": loadbank.TdiLoadbank("10.0.0.2", 10001, "fuelcell")})
+#     rig.connect()
+#     rig.telemetry = telemetry.Bus()  # One merged sample per update
+#     rig.set("current_constant", "2.0")  # Every unit, or name some
+#     stamp, skew, samples = rig.update()
+
+# Import libraries
+import time
+from concurrent.futures import ThreadPoolExecutor
+import loadbank
+
+
+# Define class
+class Fleet():
+    # Code to run when class is created
+    # loadbanks is a dict of {name: TdiLoadbank}
+    def __init__(self, loadbanks):
+        self.__loadbanks = dict(loadbanks)
+
+        # One worker per loadbank so polling time doesn't grow with the fleet
+        self.__pool = ThreadPoolExecutor(max_workers=max(1, len(self.__loadbanks)))
+
+        # Define internal variables
+        self.__latest = None
+
+        # Optional telemetry.Bus that update() publishes each merged sample to
+        self.telemetry = None
+
+    # Method to run a function on the chosen loadbanks at the same time
+    def _each(self, function, names=None):
+        if names is None:
+            names = list(self.__loadbanks)
+        elif isinstance(names, str):
+            names = [names]
+
+        # Start everything first, then collect the answers
+        jobs = {name: self.__pool.submit(function, self.__loadbanks[name]) for name in names}
+        return {name: job.result() for name, job in jobs.items()}
+
+    # Method to connect to every loadbank, returns the number connected
+    def connect(self):
+        results = self._each(lambda load: load.connect())
+        for name, result in results.items():
+            if not result:
+                print("Loadbank '" + name + "' failed to connect")
+        return sum(1 for result in results.values() if result)
+
+    # Method to close down every loadbank, returns 0 if any load could not be seen to be off
+    def shutdown(self):
+        results = self._each(lambda load: load.shutdown())
+        self.__pool.shutdown()
+        return int(all(results.values()))
+
+    # Method to zero every loadbank
+    def zero(self, names=None):
+        self._each(lambda load: load.zero(), names)
+
+    # Method to set a property on one, some or all (None) of the loadbanks
+    # eg. fleet.set('current_constant', '2.0', ['stack1', 'stack2'])
+    def set(self, attribute, value, names=None):
+        self._each(lambda load: setattr(load, attribute, value), names)
+
+    # Method to get a property from one, some or all (None) of the loadbanks
+    def get(self, attribute, names=None):
+        return self._each(lambda load: getattr(load, attribute), names)
+
+    # Update electrical data on every loadbank at the same time
+    # Returns [time, skew, {name: (voltage, current, power)}]
+    def update(self):
+        results = self._each(self._sample)
+
+        # Align the sample to the middle of all the polls
+        stamps = [stamp for stamp, data in results.values() if data]
+        if stamps:
+            stamp = sum(stamps) / len(stamps)
+            skew = max(stamps) - min(stamps)
+        else:
+            stamp = time.time()
+            skew = 0.0
+
+        self.__latest = [stamp, skew, {name: data for name, (t, data) in results.items()}]
+
+        # Share the merged sample, a unit that didn't answer is None
+        if self.telemetry:
+            self.telemetry.publish({
+                "time":      stamp,
+                "skew":      skew,
+                "loadbanks": {name: dict(zip(("voltage", "current", "power"), data)) if data else None
+                              for name, (t, data) in results.items()},
+            })
+        return self.__latest
+
+    # Method to poll one loadbank, returns the time in the middle of the poll
+    @staticmethod
+    def _sample(load):
+        start = time.time()
+        try:
+            load.update()
+        except loadbank.LoadbankError as error:
+            print("Loadbank: " + str(error))
+            return start, None
+        return (start + time.time()) / 2, (load.voltage, load.current, load.power)
+
+    # Property - The most recent merged sample
+    @property
+    def latest(self):
+        return self.__latest
+
+    # Property - The names of the loadbanks in the fleet
+    @property
+    def names(self):
+        return list(self.__loadbanks)
+
+    # Method to get one loadbank by name
+    def __getitem__(self, name):
+        return self.__loadbanks[name]
+
+    # Method to count the loadbanks
+    def __len__(self):
+        return len(self.__loadbanks)
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+# Recent sample history for the TDi Loadbank Controller
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Keeps the last few hours of samples in fixed numpy arrays so memory never
+# grows, and answers statistics over a recent window without reading the log:
+#     recent = history.History(100000)
+#     recent.append(time.monotonic(), [setpoint, voltage, current, power])
+#     recent.statistics(60.0)["current"]["max"]
+#
+# Needs numpy, main.py carries on without it.
+
+# Import libraries
+import time, warnings
+import numpy
+
+
+# Channels kept for each sample
+CHANNELS = ("setpoint", "voltage", "current", "power")
+
+# Statistics worked out for each channel
+STATISTICS = ("min", "max", "mean", "std", "rms")
+
+
+# Define class
+class History():
+    # Code to run when class is created, capacity is the most samples kept
+    def __init__(self, capacity=100000, channels=CHANNELS):
+        if capacity <= 0:
+            raise ValueError("History capacity must be positive")
+
+        # Define internal variables
+        self.__channels = tuple(channels)
+        self.__times = numpy.zeros(capacity)  # Monotonic seconds
+        self.__values = numpy.zeros((len(self.__channels), capacity))  # A row per channel so each is contiguous
+        self.__next = 0  # Row the next sample goes in
+        self.__count = 0
+
+    # Method to add a sample, the oldest is overwritten once full
+    # Values are one per channel, anything that isn't a number is kept as nan
+    def append(self, stamp, values):
+        row = self.__next
+        self.__times[row] = stamp
+        for channel, value in enumerate(values):
+            try:
+                self.__values[channel, row] = value
+            except (TypeError, ValueError):
+                self.__values[channel, row] = numpy.nan
+        self.__next = (row + 1) % len(self.__times)
+        self.__count = min(self.__count + 1, len(self.__times))
+
+    # Method to get the samples from the last few seconds, [times, values] oldest first
+    # values has a row per channel
+    # Only copies if the window wraps round the end of the arrays
+    def window(self, seconds, now=None):
+        cutoff = (time.monotonic() if now is None else now) - seconds
+
+        # The newest samples are in [0, next), older ones in [next, count) once it has wrapped
+        newer = slice(0, self.__next)
+        older = slice(self.__next, self.__count)
+
+        # Times only go up within each part, so binary search for the start of the window
+        start = numpy.searchsorted(self.__times[older], cutoff)
+        if start < older.stop - older.start:
+            start += older.start
+            return [numpy.concatenate((self.__times[start:self.__count], self.__times[newer])),
+                    numpy.concatenate((self.__values[:, start:self.__count], self.__values[:, newer]), axis=1)]
+        start = numpy.searchsorted(self.__times[newer], cutoff)
+        return [self.__times[start:self.__next], self.__values[:, start:self.__next]]
+
+    # Method to work out the statistics over the last few seconds
+    # Returns {channel: {statistic: value}}, empty if there are no samples
+    def statistics(self, seconds, now=None):
+        times, values = self.window(seconds, now)
+        if not len(times):
+            return {}
+
+        # Every channel at once
+        if not numpy.isnan(values).any():
+            mean = values.mean(axis=1)
+            centred = values - mean[:, None]
+            results = {
+                "min":  values.min(axis=1),
+                "max":  values.max(axis=1),
+                "mean": mean,
+                "std":  numpy.sqrt(numpy.einsum('ij,ij->i', centred, centred) / len(times)),
+                "rms":  numpy.sqrt(numpy.einsum('ij,ij->i', values, values) / len(times)),
+            }
+
+        # Slower, leaving out the nan samples
+        else:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # A channel of only nan gives nan
+                results = {
+                    "min":  numpy.nanmin(values, axis=1),
+                    "max":  numpy.nanmax(values, axis=1),
+                    "mean": numpy.nanmean(values, axis=1),
+                    "std":  numpy.nanstd(values, axis=1),
+                    "rms":  numpy.sqrt(numpy.nanmean(numpy.square(values), axis=1)),
+                }
+        return {name: {statistic: float(results[statistic][channel]) for statistic in STATISTICS}
+                for channel, name in enumerate(self.__channels)}
+
+    # Method to describe the statistics over the last few seconds
+    def describe(self, seconds, now=None):
+        statistics = self.statistics(seconds, now)
+        if not statistics:
+            return "No samples in the last {0:g}s".format(seconds)
+        lines = ["Last {0:g}s, {1} samples".format(seconds, len(self.window(seconds, now)[0])),
+                 "{0:10s}".format("") + ''.join("{0:>10s}".format(statistic) for statistic in STATISTICS)]
+        for channel in self.__channels:
+            lines.append("{0:10s}".format(channel)
+                         + ''.join("{0:10.3f}".format(statistics[channel][statistic]) for statistic in STATISTICS))
+        return '\n'.join(lines)
+
+    # Property - Channel names
+    @property
+    def channels(self):
+        return self.__channels
+
+    # Property - How many samples are kept?
+    @property
+    def samples(self):
+        return self.__count
@@ -20,18 +20,221 @@
 #############################################################################
 
 # Import Libraries
-import telnetlib, time, os
+import time, asyncio, socket, threading, collections
+import metrics
+
+
+# Base error for anything that goes wrong talking to the Loadbank
+class LoadbankError(Exception):
+    pass
+
+
+# The Loadbank did not reply within the allowed retries
+class LoadbankTimeout(LoadbankError):
+    pass
+
+
+# The Loadbank replied with something we cannot understand
+class LoadbankReplyError(LoadbankError):
+    pass
+
+
+# The connection to the Loadbank is down, TdiLoadbank reconnects by itself
+class LoadbankDisconnected(LoadbankError):
+    pass
+
+
+# How each query reply ends, how long to wait for it and if it spans lines
+# Keyed on the exact command, see the Loadbank manual
+_REPLIES = {
+    "load": (b'\r',    0.1, False),
+    "mode": (b'\r',    0.1, False),
+    "rng":  (b'AMP',   0.1, True),
+    "v":    (b'volts', 0.1, False),
+    "i":    (b'amps',  0.1, False),
+    "p":    (b'watts', 0.1, False),
+    "vl":   (b'volts', 0.1, False),
+    "il":   (b'amps',  0.1, False),
+    "pl":   (b'watts', 0.1, False),
+    "uv":   (b'volts', 0.1, False),
+    "cv":   (b'volts', 0.1, False),
+    "ci":   (b'amps',  0.1, False),
+    "cp":   (b'watts', 0.1, False),
+}
+_DEFAULT_REPLY = (b'\r', 0.1, False)
+
+# Commands behind each property, for TdiLoadbank.force
+_ATTRIBUTE_COMMANDS = {
+    "load":             ("load",),
+    "range":            ("rng",),
+    "mode":             ("mode",),
+    "voltage_constant": ("cv",),
+    "current_constant": ("ci",),
+    "power_constant":   ("cp",),
+    "voltage_limit":    ("vl",),
+    "current_limit":    ("il",),
+    "power_limit":      ("pl",),
+    "voltage_minimum":  ("uv",),
+}
+
+# Commands that must reach the Loadbank in the order they were written
+_ORDERED_COMMANDS = ("load", "mode")
+
+# Settings remembered by TdiLoadbank.refresh
+_SETTING_COMMANDS = ["load", "mode", "rng", "vl", "il", "pl", "uv"]
+
+# TCP keepalive so a dead link is noticed while idle, seconds idle, seconds between probes, probes
+_KEEPALIVE = (1, 1, 3)
+
+# Setpoint command for each mode
+_MODE_SETPOINTS = {"VOLTAGE": "cv", "CURRENT": "ci", "POWER": "cp"}
+
+# Order to send settings again, limits before setpoints and the load last
+_RESYNC_ORDER = ["mode", "rng", "vl", "il", "pl", "uv", "cv", "ci", "cp", "load"]
+
+# Reply framing states
+_IDLE, _BODY, _DONE = 0, 1, 2
+
+# Reply framing transitions, (state, byte is a line end) -> next state
+_FRAMING = {
+    (_IDLE, True):  _IDLE,  # Skip line ends left over from the last reply
+    (_IDLE, False): _BODY,  # First character of the reply
+    (_BODY, True):  _IDLE,  # Stale partial line, start again
+    (_BODY, False): _BODY,
+}
+
+
+# Function to find the command a query or setting is for
+def _command_of(inbuf):
+    return inbuf.strip().split()[0].rstrip('?')
+
+
+# Class to frame one query reply out of the datastream
+class _Reply():
+    # Code to run when class is created
+    def __init__(self, terminator, multiline=False):
+        self.__terminator = terminator
+        self.__multiline = multiline
+        self.__state = _IDLE
+        self.__body = bytearray()
+
+    # Method to add received bytes, returns True once the reply is complete
+    def feed(self, data):
+        for byte in data:
+            line_end = byte in b'\r\n\x00'
+
+            # Keep the byte if we are inside the reply, done at the expected ending
+            if self.__state == _BODY or not line_end:
+                self.__body.append(byte)
+                if self.__body.endswith(self.__terminator):
+                    self.__state = _DONE
+                    break
+
+            # Multi-line replies keep everything up to the ending
+            if not (self.__multiline and self.__state == _BODY):
+                self.__state = _FRAMING[(self.__state, line_end)]
+            if self.__state == _IDLE:
+                del self.__body[:]
+
+        return self.__state == _DONE
+
+    # Property - The decoded reply
+    @property
+    def text(self):
+        return self.__body.decode('ascii', 'replace').strip('\r\n')
+
+
+# Function to turn a load reply into boolean
+def _load_state(state):
+    if "on" in state:
+        return True
+    elif "off" in state:
+        return False
+    else:
+        return "UNKNOWN STATE"
+
+
+# Function to turn a mode reply or setting into the mode name, blank if unknown
+def _mode_name(op_mode):
+    op_mode = op_mode.lower()
+    if "vo" in op_mode or "cv" in op_mode:
+        return "VOLTAGE"
+    elif "cu" in op_mode or "ci" in op_mode:
+        return "CURRENT"
+    elif "po" in op_mode or "cp" in op_mode:
+        return "POWER"
+    return ""
+
+
+# Function to find what the Loadbank setting is after sending a value
+def _from_setting(command, value):
+    if command == "load":
+        return value == "on"
+    elif command == "mode":
+        return _mode_name(value)
+    return _normal(value)
+
+
+# Function to turn a query reply into what _from_setting expects, None if invalid
+def _from_reply(command, reply):
+    if command == "load":
+        return _load_state(reply)
+    elif command == "mode":
+        return _mode_name(reply)
+    elif command == "rng":
+        return _to_float(' '.join(reply.split()[1:]))  # "RANGE 9 30.0 AMP"
+    return _to_float(reply)
+
+
+# Function to compare setting values, "2" and "2.00" are the same
+def _normal(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value).strip().lower()
+
+
+# Function to read the number at the start of a reply, None if invalid
+def _to_float(data):
+    try:
+        return float(data.split()[0])
+    except (ValueError, IndexError):
+        return None
 
 
 # Define Class
 class TdiLoadbank():
     # Code to run when class is created
-    def __init__(self, HOST, PORT=23, password=''):
+    # ttl is how many seconds a remembered setting is trusted before asking the Loadbank again
+    # write_depth is how many writes can wait when write_behind is on
+    def __init__(self, HOST, PORT=23, password='', timeouts=None, retries=3, backoff=0.01, ttl=1.0,
+                 write_depth=64, timeout=2.0, reconnect_backoff=0.5, reconnect_max=30.0, dead_after=3):
         
         # Define network connection information
         self.__HOST = HOST
         self.__PORT = PORT  # Default 23 if not specified
         self.__password = password  # Default blank if not specified
+        self.__timeout = timeout  # Time allowed to connect
+
+        # Define reply handling, timeouts in seconds per command
+        self.timeouts = {command: reply[1] for command, reply in _REPLIES.items()}
+        self.timeouts.update(timeouts or {})
+        self.retries = retries  # Resends allowed before giving up
+        self.backoff = backoff  # First wait between resends, doubles each time
+        self.resends = 0  # Count of queries that had to be asked again
+
+        # One query or command on the wire at a time, shared between threads
+        self._lock = threading.RLock()
+        self.__latency = None
+
+        # Link statistics, see metrics.py
+        self.round_trips = {}  # Query round trip times, {command: metrics.Histogram}
+        self.timed_out = collections.Counter()  # Replies that didn't arrive in time, per command
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+        # Optional telemetry.Bus that update() publishes each sample to
+        self.telemetry = None
         
         # Define Loadbank commands
         self.__LOAD_COMMAND = "load"
@@ -57,48 +260,113 @@ class TdiLoadbank():
         self.__set_i   = "0"
         self.__set_p   = "0"
 
+        # Last value sent for each setting as it was sent, so the same value isn't sent
+        # twice and a reconnect sends exactly the same again
+        self.__sent = {}
+        self.suppressed = 0  # Count of writes not sent as nothing changed
+
+        # Optional queue of writes sent from a background thread
+        self.__write_behind = False
+        self.__writer = None
+        self.__pending = collections.deque()  # [command, value] oldest first
+        self.__sending = None  # [command, value] taken off the queue and being sent
+        self.__pending_ready = threading.Condition(self._lock)
+        self.write_depth = write_depth  # Most writes allowed to wait
+        self.coalesced = 0  # Count of queued writes replaced by a newer value
+        self.dropped = 0  # Count of writes dropped as the queue was full
+
+        # What we believe the Loadbank settings are, {command: [value, time]}
+        self.__mirror = {}
+        self.ttl = ttl
+
+        # Reconnecting after the connection is lost
+        self.reconnect_backoff = reconnect_backoff  # First wait between reconnects, doubles each time
+        self.reconnect_max = reconnect_max  # Longest wait between reconnects
+        self.dead_after = dead_after  # Queries in a row with no reply before the link counts as lost
+        self.__up = True
+        self.__down_since = None
+        self.__retry_at = 0.0
+        self.__retry_delay = reconnect_backoff
+        self.__silent = 0
+        self.outages = 0  # Count of times the connection was lost
+        self.reconnects = 0  # Count of successful reconnects
+        self.outage_last = 0.0  # Seconds the last outage lasted
+        self.outage_total = 0.0  # Seconds spent disconnected in total
+
     # Method to connect over the network
     def connect(self):
         
-        # Ping the loadbank first to see if it is there
-        if os.system("ping -c 1 -w 2 " + self.__HOST + " > /dev/null 2>&1"):
+        # Connect using telnet, if nothing answers within the timeout there is no loadbank
+        try:
+            self._tn = self._connect(self.__HOST, self.__PORT, self.__password, self.__timeout)
+        except OSError:
             print("Failed to detect a loadbank on network")
             return 0
         print("Loadbank found! Connecting...", end="")
 
-        # Connect using telnet
-        self._tn = self._connect(self.__HOST, self.__PORT, self.__password)
-
         if self._tn:
             print("connected!\n")
         else:
             print("Failed, check password?\n")
             return 0
 
-        # Get safety limits
-        self.__set_v = self._get(self._tn, self.__CONSTANT_VOLTAGE_COMMAND).split()[0]
-        self.__set_i = self._get(self._tn, self.__CONSTANT_CURRENT_COMMAND).split()[0]
-        self.__set_p = self._get(self._tn, self.__CONSTANT_POWER_COMMAND).split()[0]
+        # Get the setpoints and settings in one go, the Loadbank already has these so no need to send them
+        self.invalidate()
+        setpoints = [self.__CONSTANT_VOLTAGE_COMMAND, self.__CONSTANT_CURRENT_COMMAND, self.__CONSTANT_POWER_COMMAND]
+        try:
+            with self._lock:
+                replies = self._get_many(self._tn, setpoints + _SETTING_COMMANDS)
+                self._remember(_SETTING_COMMANDS, replies[len(setpoints):])
 
-        # Get current mode
-        self.mode = self._get(self._tn, self.__MODE_COMMAND)
+                # Ask again one at a time for any setpoint that didn't come back
+                for n, command in enumerate(setpoints):
+                    if replies[n] is None:
+                        self.resends += 1
+                        replies[n] = self._get(self._tn, command)
+                    self.__sent[command] = replies[n].split()[0]
+                self.__set_v, self.__set_i, self.__set_p = [reply.split()[0] for reply in replies[:len(setpoints)]]
+
+                # Get current mode
+                if not self.__mode:
+                    self.__mode = _mode_name(self._get(self._tn, self.__MODE_COMMAND))
+                if self.__mode:
+                    self.__sent[self.__MODE_COMMAND] = _MODE_SETPOINTS[self.__mode]
+        except (OSError, EOFError, IndexError, LoadbankError):
+            print("Failed to read the loadbank settings, is it a loadbank?\n")
+            self._tn.close()
+            return 0
 
         # Everything working, return 1
         return 1
 
 
     # Method to connect over Telnet
+    # Raises OSError if nothing answers within the timeout, returns None if the password isn't asked for
     @classmethod
-    def _connect(cls, HOST, PORT, password):
+    def _connect(cls, HOST, PORT, password, timeout=2.0):
         
-        # Initiate connection
-        tn = telnetlib.Telnet(HOST, PORT)
+        # Initiate connection, telnetlib is gone from Python 3.13 so only import it here
+        import telnetlib
+        tn = telnetlib.Telnet(HOST, PORT, timeout)
+
+        # Send small queries straight away rather than waiting to batch them
+        sock = tn.get_socket()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # Probe the link while idle so a dead connection errors rather than hangs
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):  # Linux only
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, _KEEPALIVE[0])
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, _KEEPALIVE[1])
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, _KEEPALIVE[2])
         
         # If we have a password...
         if password:
             
             # Wait for the loadbank to ask us for a password
-            tn.read_until(b"Password ? ")
+            if not tn.read_until(b"Password ? ", timeout).endswith(b"Password ? "):
+                tn.close()
+                return None
             
             # Write the password to the Loadbank
             tn.write(password.encode('ascii') + b"\r\n")
@@ -109,17 +377,138 @@ class TdiLoadbank():
         # Return the Telnet handle
         return tn
 
-    # Method to close down the connection
+    # Method to connect again after the connection was lost and send the settings again
+    def reconnect(self):
+        with self._lock:
+            self._tn.close()
+            tn = self._connect(self.__HOST, self.__PORT, self.__password, self.__timeout)
+            if tn is None:
+                raise LoadbankDisconnected("Loadbank did not ask for the password")
+            self._tn = tn
+            self.__up = True
+            self.__silent = 0
+
+            # Send the last known settings, it may have lost them
+            self._replay()
+
+            # Connected again
+            outage = time.monotonic() - self.__down_since if self.__down_since is not None else 0.0
+            self.__down_since = None
+            self.__retry_delay = self.reconnect_backoff
+            self.reconnects += 1
+            self.outage_last = outage
+            self.outage_total += outage
+            print("Loadbank: reconnected after {0:.1f}s".format(outage))
+
+    # Method to send the last known mode, range, limits and setpoints after a reconnect
+    # The load is read back, turned off if that was asked for while the link was down,
+    # but only ever turned back on by the user
+    def _replay(self):
+        self.__mirror.clear()
+
+        # Sent straight away rather than queued so they can be read back, load last
+        commands = [command for command in _RESYNC_ORDER
+                    if command != self.__LOAD_COMMAND and command in self.__sent]
+        for command in commands:
+            self._send(self._tn, command + ' ' + self.__sent[command] + '\r')
+        wrong = self._confirm(commands)
+        if wrong:
+            print("Loadbank: did not take " + ", ".join(command + " " + self.__sent[command] for command in wrong)
+                  + " after reconnecting. CHECK THE LOADBANK SETTINGS!")
+
+        wanted = self.__sent.get(self.__LOAD_COMMAND)
+        state = self.fresh("load")
+        if wanted == "off" and state is not False:
+            self._set(self._tn, self.__LOAD_COMMAND, "off", force=True)
+            print("Loadbank: the load was still on after reconnecting, turned it off")
+        elif wanted == "on" and state is not True:
+            self.__sent.pop(self.__LOAD_COMMAND, None)  # So the next 'load on' is sent
+            print("Loadbank: the load is off after reconnecting, turn it back on with 'load on'")
+        elif state == "UNKNOWN STATE":
+            self.__sent.pop(self.__LOAD_COMMAND, None)
+
+    # Method to read back settings that were just sent, sending again any the Loadbank
+    # doesn't have, like setup, returns the commands it still doesn't have
+    def _confirm(self, commands):
+        wrong = list(commands)
+        for attempt in range(self.retries + 1):
+            if not wrong:
+                break
+            replies = self._get_many(self._tn, wrong)
+            self._remember(wrong, replies)
+            wrong = [command for command, reply in zip(wrong, replies) if reply is None
+                     or _from_reply(command, reply) != _from_setting(command, self.__sent[command])]
+            if wrong and attempt < self.retries:
+                self.resends += len(wrong)
+                time.sleep(self._backoff(attempt + 1))
+                for command in wrong:
+                    self._send(self._tn, command + ' ' + self.__sent[command] + '\r')
+        return wrong
+
+    # Method to give up on the connection, raises LoadbankDisconnected
+    def _lost(self, error):
+        now = time.monotonic()
+        if self.__down_since is None:
+            self.__down_since = now
+            self.outages += 1
+            self.__retry_at = now  # Try straight away the first time
+            print("Loadbank: connection lost, " + (str(error) or type(error).__name__))
+        else:
+            self.__retry_at = now + self.__retry_delay
+        self.__up = False
+        self._tn.close()
+        raise LoadbankDisconnected("Loadbank connection lost") from error
+
+    # Method to find the connection to use, reconnecting first if it was lost
+    # Raises LoadbankDisconnected straight away if it isn't time to try again yet
+    # Always the current connection, the tn the caller read before taking the lock
+    # is closed if another thread reconnected in the meantime
+    def _recover(self, tn):
+        if self.__up:
+            return self._tn
+        now = time.monotonic()
+        if now < self.__retry_at:
+            raise LoadbankDisconnected("Loadbank disconnected, reconnecting in {0:.1f}s".format(self.__retry_at - now))
+        try:
+            self.reconnect()
+        except (OSError, EOFError, LoadbankError) as error:
+            self.__up = False
+            self.__retry_at = time.monotonic() + self.__retry_delay
+            self.__retry_delay = min(2 * self.__retry_delay, self.reconnect_max)
+            raise LoadbankDisconnected("Loadbank reconnect failed, " + (str(error) or type(error).__name__)) from error
+        return self._tn
+
+    # Property - Is the connection up?
+    @property
+    def connected(self):
+        return self.__up
+
+    # Property - Seconds the connection has been down for, 0 if it is up
+    @property
+    def outage(self):
+        return time.monotonic() - self.__down_since if self.__down_since is not None else 0.0
+
+    # Method to close down the connection, returns 0 if the load could not be seen to be off
     def shutdown(self):
         time.sleep(0.4)
+        self.write_behind = False  # Send anything queued then write directly
+        self.invalidate()  # Always send the shutdown commands
         self.load = False
         self.zero()
+
+        # Check the load really went off, it is only sent again on reconnect
+        try:
+            off = self.fresh("load") is False
+        except LoadbankError:
+            off = False
         self._tn.close()
+        if not off:
+            print("Loadbank: could not turn the load off. TURN IT OFF MANUALLY!")
+            return 0
         return 1
 
     # Method to zero the Loadbank
     def zero(self):
-        time.sleep(0.4)
         if "VOLTAGE" in self.mode:
             self.voltage_constant = '0.0'
         elif "CURRENT" in self.mode:
@@ -132,19 +521,242 @@ class TdiLoadbank():
     def _flush(tn):
         tn.read_very_eager()  # Flush read buffer
 
-    # Method to set a value
-    @classmethod
-    def _set(cls, tn, command, value):
-        
-        # Build the command in the correct format
-        buf = (command + ' ' + value + '\r')
-        
-        # Send the command over the network
-        cls._send(tn, buf)
+    # Method to set a value, returns False if it was already set
+    def _set(self, tn, command, value, force=False):
+        with self._lock:
+
+            # Don't send what the Loadbank already has
+            if not force and command in self.__sent and _normal(self.__sent[command]) == _normal(value):
+                self.suppressed += 1
+                return False
+
+            # Queue it to send in the background, or send it now
+            if self.__write_behind:
+                if not self._queue(command, value):
+                    return False
+            else:
+                # Build the command in the correct format
+                buf = (command + ' ' + value + '\r')
+
+                # Send the command over the network, if the link is down it goes when it comes back
+                try:
+                    self._send(tn, buf)
+                except LoadbankDisconnected:
+                    self.__sent[command] = value  # See _replay
+                    self.__mirror.pop(command, None)  # The Loadbank doesn't have it yet
+                    return True
+            self.__sent[command] = value
+
+            # The Loadbank now has this setting
+            if command == self.__RANGE_COMMAND:
+                self.__mirror.pop(command, None)  # Only the Loadbank knows how it describes a range
+            else:
+                self._mirror(command, _from_setting(command, value))
+            return True
+
+    # Method to add a write to the write-behind queue, False if it had to be dropped
+    # A newer value replaces one still waiting for the same command, unless an
+    # order sensitive command (load, mode) is waiting between them
+    def _queue(self, command, value):
+        with self.__pending_ready:
+            if command not in _ORDERED_COMMANDS:
+                for item in reversed(self.__pending):
+                    if item[0] in _ORDERED_COMMANDS:
+                        break
+                    if item[0] == command:
+                        item[1] = value
+                        self.coalesced += 1
+                        return True
+
+                # Nothing to replace and no room, drop it and make sure the next one goes
+                if len(self.__pending) >= self.write_depth:
+                    self.dropped += 1
+                    self.__sent.pop(command, None)
+                    return False
+
+            self.__pending.append([command, value])
+            self.__pending_ready.notify_all()
+            return True
+
+    # Method to send queued writes from the background thread
+    def _writer(self):
+        while True:
+            with self.__pending_ready:
+                while not self.__pending and self.__write_behind:
+                    self.__pending_ready.wait()
+                if not self.__pending:
+                    return
+
+                # Take the oldest write off the queue so nothing newer can be merged into it
+                self.__sending = self.__pending.popleft()
+                command, value = self.__sending
+
+            # Send it, flush_writes waits for this too
+            try:
+                self._send(self._tn, command + ' ' + value + '\r')
+            except LoadbankDisconnected:
+                pass  # Sent again once reconnected
+            except (LoadbankError, OSError, EOFError) as error:
+                print("Loadbank: failed to send '" + command + " " + value + "', " + str(error))
+                self.invalidate(command)
+
+            with self.__pending_ready:
+                self.__sending = None
+                self.__pending_ready.notify_all()
+
+    # Method to wait until every queued write has been sent, False on timeout
+    def flush_writes(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__pending_ready:
+            while self.__pending or self.__sending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.__pending_ready.wait(remaining)
+        return True
+
+    # Property - Are writes sent in the background?
+    @property
+    def write_behind(self):
+        return self.__write_behind
+
+    # Property - Send writes in the background, turning it off sends anything queued first
+    @write_behind.setter
+    def write_behind(self, enabled):
+        if enabled and not self.__write_behind:
+            self.__write_behind = True
+            self.__writer = threading.Thread(target=self._writer, name="loadbank-writer", daemon=True)
+            self.__writer.start()
+        elif not enabled and self.__write_behind:
+            with self.__pending_ready:
+                self.__write_behind = False
+                self.__pending_ready.notify_all()
+            self.__writer.join()
+
+    # Property - How many writes are waiting to be sent, including one being sent?
+    @property
+    def write_queue_depth(self):
+        return len(self.__pending) + (self.__sending is not None)
+
+    # Method to forget what was sent for some commands, or all of them
+    # eg. load.invalidate("ci", "load") so the next writes always go
+    def invalidate(self, *commands):
+        with self._lock:
+            if commands:
+                for command in commands:
+                    self.__sent.pop(command, None)
+                    self.__mirror.pop(command, None)
+            else:
+                self.__sent.clear()
+                self.__mirror.clear()
+
+    # Method to set a property even if the value hasn't changed
+    # eg. load.force("current_constant", "2.0")
+    def force(self, attribute, value):
+        with self._lock:
+            self.invalidate(*_ATTRIBUTE_COMMANDS.get(attribute, ()))
+            setattr(self, attribute, value)
+
+    # Method to remember a Loadbank setting
+    def _mirror(self, command, value):
+        self.__mirror[command] = [value, time.monotonic()]
+
+    # Method to read a setting, asking the Loadbank only if what we have is too old
+    def _mirrored(self, command, read, max_age=None):
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            entry = self.__mirror.get(command)
+            if entry is not None and time.monotonic() - entry[1] <= max_age:
+                return entry[0]
+            value = read()
+            if value != "UNKNOWN STATE":
+                self._mirror(command, value)
+            return value
+
+    # Method to find how old a remembered setting is in seconds, inf if unknown
+    # eg. load.age("load")
+    def age(self, attribute):
+        commands = _ATTRIBUTE_COMMANDS.get(attribute, (attribute,))
+        entry = self.__mirror.get(commands[0])
+        return time.monotonic() - entry[1] if entry else float('inf')
+
+    # Method to read a property straight from the Loadbank, for safety checks
+    # eg. if load.fresh("load"): ...
+    def fresh(self, attribute):
+        with self._lock:
+            self.invalidate(*_ATTRIBUTE_COMMANDS.get(attribute, ()))
+            return getattr(self, attribute)
+
+    # Method to read every remembered setting from the Loadbank in one go
+    def refresh(self):
+        with self._lock:
+            self._remember(_SETTING_COMMANDS, self._get_many(self._tn, _SETTING_COMMANDS))
+
+    # Method to remember the replies to some setting queries
+    def _remember(self, commands, replies):
+        for command, reply in zip(commands, replies):
+            if reply is None:
+                continue
+            if command == self.__LOAD_COMMAND:
+                value = _load_state(reply)
+            elif command == self.__MODE_COMMAND:
+                value = _mode_name(reply)
+                if value:
+                    self.__mode = value
+            elif command == self.__RANGE_COMMAND:
+                value = reply
+            else:
+                value = _to_float(reply)
+            if value is not None and value != "UNKNOWN STATE" and value != "":
+                self._mirror(command, value)
+
+    # Method to apply settings in order then read them all back in one go to check
+    # they took, settings is a list of [property, value]
+    # eg. load.setup([["mode", "CURRENT"], ["range", "9"], ["current_limit", "30.0"]])
+    def setup(self, settings):
+        with self._lock:
+            for attribute, value in settings:
+                setattr(self, attribute, value)
+
+            for attempt in range(self.retries + 1):
+                # Wait for any queued writes to go before reading back
+                self.flush_writes()
+                commands = [_ATTRIBUTE_COMMANDS[attribute][0] for attribute, value in settings]
+                replies = self._get_many(self._tn, commands)
+
+                # Find anything the Loadbank doesn't have
+                wrong = []
+                for (attribute, value), command, reply in zip(settings, commands, replies):
+                    if command == self.__LOAD_COMMAND:
+                        wanted = bool(value)
+                    else:
+                        wanted = _from_setting(command, value)
+                    if reply is None or _from_reply(command, reply) != wanted:
+                        wrong.append([attribute, value])
+                if not wrong:
+                    return True
+
+                # Send those again
+                if attempt < self.retries:
+                    self.resends += len(wrong)
+                    time.sleep(self._backoff(attempt + 1))
+                    for attribute, value in wrong:
+                        self.force(attribute, value)
+                    settings = wrong
+
+        raise LoadbankReplyError("Loadbank did not take " + ", ".join(
+            attribute + " " + str(value) for attribute, value in wrong))
+
+    # Method to send everything we have set again, eg. after a reconnect
+    def resync(self, commands=_RESYNC_ORDER):
+        with self._lock:
+            sent = dict(self.__sent)
+            for command in commands:
+                if command in sent:
+                    self._set(self._tn, command, sent[command], force=True)
 
     # Method to get a string of text
-    @classmethod
-    def _get(cls, tn, command):
+    def _get(self, tn, command):
         
         # Queries end with a '?', append if necessary
         if not command.endswith('?'):
@@ -154,87 +766,172 @@ class TdiLoadbank():
         buf = (command + '\r')
         
         # Send the query over the network
-        return str(cls._send(tn, buf))
+        return str(self._send(tn, buf))
 
-    # Method to get a number **recursive**
-    @classmethod
-    def _get_float(cls, tn, command):
-        
-        # Get the raw data string
-        data = cls._get(tn, command)
-        
-        # Look for a valid reply
-        try:
-            return float(data.split()[0])
-            
-        # No valid reply so run the method again
-        except ValueError:
-            return cls._get_float(tn, command) # **recursivity**
+    # Method to get a number
+    def _get_float(self, tn, command):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.resends += 1
+                time.sleep(self._backoff(attempt))
+
+            # Get the raw data string
+            data = self._get(tn, command)
+
+            # Look for a valid reply, otherwise ask again
+            value = _to_float(data)
+            if value is not None:
+                return value
+
+        raise LoadbankReplyError("Invalid reply to '" + command + "': " + repr(data))
+
+    # Method to get several strings of text with one write **pipelined**
+    # Replies that don't come back are None
+    def _get_many(self, tn, commands):
+
+        # Build all the queries in the correct format
+        queries = [(c if c.endswith('?') else c + '?') + '\r' for c in commands]
+
+        with self._lock:
+            tn = self._recover(tn)
+            try:
+                # Flush the buffer
+                self._flush(tn)
+
+                # Send every query in one go
+                data = ''.join(queries).encode('ascii')
+                sent = time.monotonic()
+                tn.write(data)
+                self.bytes_out += len(data)
+
+                # The Loadbank answers in order so read each reply in turn
+                replies = []
+                for query in queries:
+                    outbuf = self._read_reply(tn, query, sent)
+                    if outbuf is not None and not replies:
+                        self._measured(time.monotonic() - sent)
+                    replies.append(outbuf)
+            except (OSError, EOFError) as error:
+                self._lost(error)
+
+        # Return the replies in the order asked for
+        return replies
+
+    # Method to get several numbers with one write **pipelined**
+    def _get_floats(self, tn, commands):
+        values = [_to_float(outbuf) if outbuf is not None else None
+                  for outbuf in self._get_many(tn, commands)]
+
+        # Ask again one at a time for anything that didn't come back valid
+        for n, value in enumerate(values):
+            if value is None:
+                self.resends += 1
+                values[n] = self._get_float(tn, commands[n])
+
+        # Return the numbers in the order asked for
+        return values
+
+    # Method to find how a query reply ends and how long to wait for it
+    def _reply_for(self, inbuf):
+        command = _command_of(inbuf)
+        terminator, timeout, multiline = _REPLIES.get(command, _DEFAULT_REPLY)
+        return terminator, self.timeouts.get(command, timeout), multiline
+
+    # Method to wait before a resend, doubling each attempt
+    def _backoff(self, attempt):
+        return self.backoff * 2 ** (attempt - 1)
+
+    # Method to read one framed reply, None on timeout
+    # sent is when the query went, to time the round trip
+    def _read_reply(self, tn, inbuf, sent=None):
+        terminator, timeout, multiline = self._reply_for(inbuf)
+        reply = _Reply(terminator, multiline)
+        deadline = time.monotonic() + timeout
+
+        # Keep reading until the reply is complete or we run out of time
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.timed_out[_command_of(inbuf)] += 1
+                return None
+            data = tn.read_until(terminator, remaining)
+            self.bytes_in += len(data)
+            if reply.feed(data):
+                if sent is not None:
+                    command = _command_of(inbuf)
+                    if command not in self.round_trips:
+                        self.round_trips[command] = metrics.Histogram()
+                    self.round_trips[command].observe(time.monotonic() - sent)
+                return reply.text
+
+    # Method to keep a smoothed estimate of the one way link latency, a reply arrived so the link is alive
+    def _measured(self, round_trip):
+        self.__silent = 0
+        if self.__latency is None:
+            self.__latency = round_trip / 2
+        else:
+            self.__latency += 0.1 * (round_trip / 2 - self.__latency)
+
+    # Property - Estimated time for a command to reach the Loadbank, seconds
+    @property
+    def latency(self):
+        return self.__latency or 0.0
 
     # Method to handle data 2way telnet datastream
-    @classmethod
-    def _send(cls, tn, inbuf):
-        
-        # Flush the buffer
-        cls._flush(tn)
-        
-        # Create some memory
-        outbuf = ""
-
-        # Send the query or command to the Loadbank
-        tn.write(inbuf.encode('ascii'))
-
-        # Was it a query? If so what is the expected reply?
-        if '?' in inbuf:
-            if 'v' in inbuf:
-                expected = b'volts'
-            elif 'i' in inbuf:
-                expected = b'amps'
-            elif 'p' in inbuf:
-                expected = b'watts'
-            elif 'rng' in inbuf:
-                expected = b'AMP'
-            else:
-                expected = b'\r'
+    def _send(self, tn, inbuf):
+        with self._lock:
+            tn = self._recover(tn)
+            try:
+                return self._exchange(tn, inbuf)
+            except (OSError, EOFError) as error:
+                self._lost(error)
+            except LoadbankTimeout as error:
+                # Several queries in a row with no reply, the link is dead
+                self.__silent += 1
+                if self.__silent >= self.dead_after:
+                    self._lost(error)
+                raise
+
+    # Method to send a command or query over a working connection
+    def _exchange(self, tn, inbuf):
 
-            # Check if the Loadbank acknowledged the query
-            while not outbuf or outbuf.isspace():
-                
-                # Look for the expected reply or timeout
-                outbuf = tn.read_until(expected, 0.1)  # Timeout = 0.1sec TODO
-                
-                # Decode the reply
-                outbuf = outbuf.decode('ascii').strip('\r\n')
-                
-                # If the reply is not what we expected...
-                if not outbuf or outbuf.isspace():
-                    # Flush the buffer
-                    cls._flush(tn)
-                    
-                    # Send the query again
-                    tn.write(inbuf.encode('ascii'))
-
-            # Return the query reply
-            return outbuf
-            
         # Was a command not a query, no reply expected.
-        else:
+        if '?' not in inbuf:
+            self._flush(tn)
+            tn.write(inbuf.encode('ascii'))
+            self.bytes_out += len(inbuf)
             return inbuf
 
+        # Was it a query? Send it until we get the expected reply
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.resends += 1
+                time.sleep(self._backoff(attempt))
+
+            # Flush the buffer
+            self._flush(tn)
+
+            # Send the query to the Loadbank
+            sent = time.monotonic()
+            tn.write(inbuf.encode('ascii'))
+            self.bytes_out += len(inbuf)
+
+            # Look for the expected reply or timeout
+            outbuf = self._read_reply(tn, inbuf, sent)
+            if outbuf is not None:
+                self._measured(time.monotonic() - sent)
+                return outbuf
+
+        raise LoadbankTimeout("No reply to '" + inbuf.strip() + "' after "
+                              + str(self.retries + 1) + " attempts")
+
     # Property - Is the load on or off?
     @property
     def load(self):
         
-        # Query the Loadbank
-        state = self._get(self._tn, self.__LOAD_COMMAND)
-        
-        # Return the answer in boolean
-        if "on" in state:
-            return True
-        elif "off" in state:
-            return False
-        else:
-            return "UNKNOWN STATE"
+        # Query the Loadbank if we haven't recently, answer in boolean
+        return self._mirrored(self.__LOAD_COMMAND,
+                              lambda: _load_state(self._get(self._tn, self.__LOAD_COMMAND)))
 
     # Property - Set the Loadbank on or off
     @load.setter
@@ -247,7 +944,7 @@ class TdiLoadbank():
     # Property - What is the Loadbank sensitivity range (see Loadbank manual)
     @property
     def range(self):
-        return self._get(self._tn, self.__RANGE_COMMAND)
+        return self._mirrored(self.__RANGE_COMMAND, lambda: self._get(self._tn, self.__RANGE_COMMAND))
 
     # Property - Set a new range
     @range.setter
@@ -255,8 +952,8 @@ class TdiLoadbank():
         
         # Sanity check that the request is a number 0-9
         if int(setting) in range(1,10):
-            self._set(self._tn, self.__RANGE_COMMAND, setting)
-            print('Set new rng ' + self.range)
+            if self._set(self._tn, self.__RANGE_COMMAND, setting):
+                print('Set new rng ' + self.range)
         else:
             raise ValueError
 
@@ -288,9 +985,20 @@ class TdiLoadbank():
 
     # Update electrical data
     def update(self):
-        self.__voltage = self._get_float(self._tn, self.__VOLTAGE_COMMAND)
-        self.__current = self._get_float(self._tn, self.__CURRENT_COMMAND)
-        self.__power   = self._get_float(self._tn, self.__POWER_COMMAND)
+        self.__voltage, self.__current, self.__power = self._get_floats(
+            self._tn, [self.__VOLTAGE_COMMAND, self.__CURRENT_COMMAND, self.__POWER_COMMAND])
+
+        # Share the sample, subscribers never cause more queries
+        if self.telemetry:
+            setpoint = {"VOLTAGE": self.__set_v, "CURRENT": self.__set_i, "POWER": self.__set_p}.get(self.__mode)
+            self.telemetry.publish({
+                "time":     time.time(),
+                "mode":     self.__mode,
+                "setpoint": _to_float(setpoint) if setpoint else None,
+                "voltage":  self.__voltage,
+                "current":  self.__current,
+                "power":    self.__power,
+            })
 
 
     # Property - What is the voltage?
@@ -312,7 +1020,7 @@ class TdiLoadbank():
     # Property - What is the maximum voltage limit?
     @property
     def voltage_limit(self):
-        return self._get_float(self._tn, self.__VOLTAGE_LIMIT_COMMAND)
+        return self._mirrored(self.__VOLTAGE_LIMIT_COMMAND, lambda: self._get_float(self._tn, self.__VOLTAGE_LIMIT_COMMAND))
 
     # Property - Set a new maximum voltage limit
     @voltage_limit.setter
@@ -322,7 +1030,7 @@ class TdiLoadbank():
     # Property - What is the mimimum voltage limit?
     @property
     def voltage_minimum(self):
-        return self._get_float(self._tn, self.__VOLTAGE_MINIMUM_COMMAND)
+        return self._mirrored(self.__VOLTAGE_MINIMUM_COMMAND, lambda: self._get_float(self._tn, self.__VOLTAGE_MINIMUM_COMMAND))
 
     # Property - Set a new minimum voltage limit
     @voltage_minimum.setter
@@ -349,7 +1057,7 @@ class TdiLoadbank():
     # Property - What is the maximum current limit?
     @property
     def current_limit(self):
-        return self._get_float(self._tn, self.__CURRENT_LIMIT_COMMAND)
+        return self._mirrored(self.__CURRENT_LIMIT_COMMAND, lambda: self._get_float(self._tn, self.__CURRENT_LIMIT_COMMAND))
 
     # Property - Set a new maximum current limit?
     @current_limit.setter
@@ -376,9 +1084,454 @@ class TdiLoadbank():
     # Property - What is the maximum power limit?
     @property
     def power_limit(self):
-        return self._get_float(self._tn, self.__POWER_LIMIT_COMMAND)
+        return self._mirrored(self.__POWER_LIMIT_COMMAND, lambda: self._get_float(self._tn, self.__POWER_LIMIT_COMMAND))
 
     # Property - Set a new maximum power limit?
     @power_limit.setter
     def power_limit(self, watts):
         self._set(self._tn, self.__POWER_LIMIT_COMMAND, watts)
+
+
+# Asyncio protocol to buffer the Loadbank datastream
+class _TdiProtocol(asyncio.Protocol):
+    # Code to run when class is created
+    def __init__(self):
+        self.transport = None
+        self.buffer = bytearray()
+        self.closed = False
+        self.__waiter = None
+
+    # Method called by the event loop when the socket is open
+    def connection_made(self, transport):
+        self.transport = transport
+
+    # Method called by the event loop when new bytes arrive
+    def data_received(self, data):
+        self.buffer.extend(data)
+        self._wake()
+
+    # Method called by the event loop when the socket closes
+    def connection_lost(self, exc):
+        self.closed = True
+        self._wake()
+
+    # Method to wake up anything waiting on new data
+    def _wake(self):
+        if self.__waiter and not self.__waiter.done():
+            self.__waiter.set_result(None)
+
+    # Method to clear the buffer
+    def flush(self):
+        del self.buffer[:]
+
+    # Method to wait for the expected reply or timeout, like telnetlib read_until
+    # Raises LoadbankDisconnected once the socket has closed rather than returning straight away
+    async def read_until(self, expected, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # Look for the expected reply in what we have so far
+            index = self.buffer.find(expected)
+            if index >= 0:
+                index += len(expected)
+                data = bytes(self.buffer[:index])
+                del self.buffer[:index]
+                return data
+
+            # Nothing more will arrive once the socket has gone
+            if self.closed:
+                self.flush()
+                raise LoadbankDisconnected("Loadbank connection closed")
+
+            # Give up at the timeout
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                data = bytes(self.buffer)
+                self.flush()
+                return data
+
+            # Otherwise wait for more data to arrive
+            self.__waiter = loop.create_future()
+            try:
+                await asyncio.wait_for(self.__waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.__waiter = None
+
+
+# Define Class
+class AsyncTdiLoadbank():
+    # Code to run when class is created
+    def __init__(self, HOST, PORT=23, password='', timeout=2.0, timeouts=None, retries=3, backoff=0.01):
+
+        # Define network connection information
+        self.__HOST = HOST
+        self.__PORT = PORT  # Default 23 if not specified
+        self.__password = password  # Default blank if not specified
+        self.__timeout = timeout  # Time allowed to connect
+
+        # Define reply handling, timeouts in seconds per command
+        self.timeouts = {command: reply[1] for command, reply in _REPLIES.items()}
+        self.timeouts.update(timeouts or {})
+        self.retries = retries  # Resends allowed before giving up
+        self.backoff = backoff  # First wait between resends, doubles each time
+        self.resends = 0  # Count of queries that had to be asked again
+
+        # Define Loadbank commands
+        self.__LOAD_COMMAND = "load"
+        self.__RANGE_COMMAND = "rng"
+        self.__MODE_COMMAND = "mode"
+        self.__VOLTAGE_COMMAND = "v"
+        self.__CURRENT_COMMAND = "i"
+        self.__POWER_COMMAND = "p"
+        self.__VOLTAGE_LIMIT_COMMAND = "vl"
+        self.__CURRENT_LIMIT_COMMAND = "il"
+        self.__POWER_LIMIT_COMMAND = "pl"
+        self.__VOLTAGE_MINIMUM_COMMAND = "uv"
+        self.__CONSTANT_VOLTAGE_COMMAND = "cv"
+        self.__CONSTANT_CURRENT_COMMAND = "ci"
+        self.__CONSTANT_POWER_COMMAND = "cp"
+
+        # Define internal variables
+        self.__mode    = ""
+        self.__voltage = 0
+        self.__current = 0
+        self.__power   = 0
+        self.__set_v   = "0"
+        self.__set_i   = "0"
+        self.__set_p   = "0"
+        self._protocol = None
+        self.__lock = None
+
+    # Method to connect over the network
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+
+        # One query or command on the wire at a time
+        self.__lock = asyncio.Lock()
+
+        # Connect using a non-blocking socket
+        try:
+            transport, self._protocol = await asyncio.wait_for(
+                loop.create_connection(_TdiProtocol, self.__HOST, self.__PORT),
+                self.__timeout)
+        except (OSError, asyncio.TimeoutError):
+            print("Failed to detect a loadbank on network")
+            return 0
+        print("Loadbank found! Connecting...", end="")
+
+        # If we have a password...
+        if self.__password:
+
+            # Wait for the loadbank to ask us for a password
+            try:
+                prompt = await self._protocol.read_until(b"Password ? ", self.__timeout)
+            except LoadbankDisconnected:
+                prompt = b""
+            if not prompt.endswith(b"Password ? "):
+                print("Failed, check password?\n")
+                transport.close()
+                return 0
+
+            # Write the password to the Loadbank
+            transport.write(self.__password.encode('ascii') + b"\r\n")
+
+        # Clear the buffer
+        self._protocol.flush()
+        print("connected!\n")
+
+        # Get safety limits
+        self.__set_v = (await self._get(self.__CONSTANT_VOLTAGE_COMMAND)).split()[0]
+        self.__set_i = (await self._get(self.__CONSTANT_CURRENT_COMMAND)).split()[0]
+        self.__set_p = (await self._get(self.__CONSTANT_POWER_COMMAND)).split()[0]
+
+        # Get current mode
+        await self.set_mode(await self._get(self.__MODE_COMMAND))
+
+        # Everything working, return 1
+        return 1
+
+    # Method to close down the connection
+    async def shutdown(self):
+        await asyncio.sleep(0.4)
+        await self.set_load(False)
+        await self.zero()
+        self._protocol.transport.close()
+        return 1
+
+    # Method to zero the Loadbank
+    async def zero(self):
+        await asyncio.sleep(0.4)
+        if "VOLTAGE" in self.__mode:
+            await self.set_voltage_constant('0.0')
+        elif "CURRENT" in self.__mode:
+            await self.set_current_constant('0.0')
+        elif "POWER" in self.__mode:
+            await self.set_power_constant('0.0')
+
+    # Method to set a value
+    async def _set(self, command, value):
+
+        # Build the command in the correct format
+        buf = (command + ' ' + value + '\r')
+
+        # Send the command over the network
+        await self._send(buf)
+
+    # Method to get a string of text
+    async def _get(self, command):
+
+        # Queries end with a '?', append if necessary
+        if not command.endswith('?'):
+            command += '?'
+
+        # Build the query in the correct format
+        buf = (command + '\r')
+
+        # Send the query over the network
+        return str(await self._send(buf))
+
+    # Method to get a number
+    async def _get_float(self, command):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.resends += 1
+                await asyncio.sleep(self._backoff(attempt))
+
+            # Get the raw data string
+            data = await self._get(command)
+
+            # Look for a valid reply, otherwise ask again
+            value = _to_float(data)
+            if value is not None:
+                return value
+
+        raise LoadbankReplyError("Invalid reply to '" + command + "': " + repr(data))
+
+    # Method to get several numbers with one write **pipelined**
+    async def _get_floats(self, commands):
+
+        # Build all the queries in the correct format
+        queries = [(c if c.endswith('?') else c + '?') + '\r' for c in commands]
+
+        async with self.__lock:
+            protocol = self._protocol
+
+            # Flush the buffer
+            protocol.flush()
+
+            # Send every query in one go
+            protocol.transport.write(''.join(queries).encode('ascii'))
+
+            # The Loadbank answers in order so read each reply in turn
+            values = []
+            for query in queries:
+                outbuf = await self._read_reply(query)
+                values.append(_to_float(outbuf) if outbuf is not None else None)
+
+        # Ask again one at a time for anything that didn't come back valid
+        for n, value in enumerate(values):
+            if value is None:
+                self.resends += 1
+                values[n] = await self._get_float(commands[n])
+
+        # Return the numbers in the order asked for
+        return values
+
+    # Method to find how a query reply ends and how long to wait for it
+    def _reply_for(self, inbuf):
+        command = _command_of(inbuf)
+        terminator, timeout, multiline = _REPLIES.get(command, _DEFAULT_REPLY)
+        return terminator, self.timeouts.get(command, timeout), multiline
+
+    # Method to wait before a resend, doubling each attempt
+    def _backoff(self, attempt):
+        return self.backoff * 2 ** (attempt - 1)
+
+    # Method to read one framed reply, None on timeout
+    async def _read_reply(self, inbuf):
+        loop = asyncio.get_running_loop()
+        terminator, timeout, multiline = self._reply_for(inbuf)
+        reply = _Reply(terminator, multiline)
+        deadline = loop.time() + timeout
+
+        # Keep reading until the reply is complete or we run out of time
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            if reply.feed(await self._protocol.read_until(terminator, remaining)):
+                return reply.text
+
+    # Method to handle data 2way datastream
+    async def _send(self, inbuf):
+        async with self.__lock:
+            protocol = self._protocol
+            if protocol.closed:
+                raise LoadbankDisconnected("Loadbank connection closed")
+
+            # Was a command not a query, no reply expected.
+            if '?' not in inbuf:
+                protocol.flush()
+                protocol.transport.write(inbuf.encode('ascii'))
+                return inbuf
+
+            # Was it a query? Send it until we get the expected reply
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.resends += 1
+                    await asyncio.sleep(self._backoff(attempt))
+
+                # Flush the buffer
+                protocol.flush()
+
+                # Send the query to the Loadbank
+                protocol.transport.write(inbuf.encode('ascii'))
+
+                # Look for the expected reply or timeout
+                outbuf = await self._read_reply(inbuf)
+                if outbuf is not None:
+                    return outbuf
+
+            raise LoadbankTimeout("No reply to '" + inbuf.strip() + "' after "
+                                  + str(self.retries + 1) + " attempts")
+
+    # Coroutine - Is the load on or off?
+    async def load(self):
+
+        # Query the Loadbank
+        state = await self._get(self.__LOAD_COMMAND)
+
+        # Return the answer in boolean
+        if "on" in state:
+            return True
+        elif "off" in state:
+            return False
+        else:
+            return "UNKNOWN STATE"
+
+    # Coroutine - Set the Loadbank on or off
+    async def set_load(self, state):
+        if state:
+            await self._set(self.__LOAD_COMMAND, "on")
+        else:
+            await self._set(self.__LOAD_COMMAND, "off")
+
+    # Coroutine - What is the Loadbank sensitivity range (see Loadbank manual)
+    async def range(self):
+        return await self._get(self.__RANGE_COMMAND)
+
+    # Coroutine - Set a new range
+    async def set_range(self, setting):
+
+        # Sanity check that the request is a number 0-9
+        if int(setting) in range(1,10):
+            await self._set(self.__RANGE_COMMAND, setting)
+            print('Set new rng ' + await self.range())
+        else:
+            raise ValueError
+
+    # Coroutine - What is the current Loadbank mode
+    async def mode(self):
+        if "VOLTAGE" in self.__mode:
+            return self.__mode + " " + str(self.__set_v)
+        elif "CURRENT" in self.__mode:
+            return self.__mode + " " + str(self.__set_i)
+        elif "POWER" in self.__mode:
+            return self.__mode + " " + str(self.__set_p)
+
+    # Coroutine - Set new Loadbank mode
+    async def set_mode(self, op_mode):
+        op_mode = op_mode.lower()  # Change any capitals to lower case
+        if "vo" in op_mode or "cv" in op_mode:
+            await self._set(self.__MODE_COMMAND, self.__CONSTANT_VOLTAGE_COMMAND)
+            self.__mode =  "VOLTAGE"
+        elif "cu" in op_mode or "ci" in op_mode:
+            await self._set(self.__MODE_COMMAND, self.__CONSTANT_CURRENT_COMMAND)
+            self.__mode =  "CURRENT"
+        elif "po" in op_mode or "cp" in op_mode:
+            await self._set(self.__MODE_COMMAND, self.__CONSTANT_POWER_COMMAND)
+            self.__mode =  "POWER"
+
+    # Update electrical data
+    async def update(self):
+        self.__voltage, self.__current, self.__power = await self._get_floats(
+            [self.__VOLTAGE_COMMAND, self.__CURRENT_COMMAND, self.__POWER_COMMAND])
+
+
+    # Property - What is the voltage?
+    @property
+    def voltage(self):
+        return self.__voltage
+
+    # Coroutine - What is the voltage setpoint
+    async def voltage_constant(self):
+        return self.__set_v
+
+    # Coroutine - Set a new voltage setpoint
+    async def set_voltage_constant(self, volts):
+        await self._set(self.__CONSTANT_VOLTAGE_COMMAND, volts)
+        self.__set_v = volts
+
+    # Coroutine - What is the maximum voltage limit?
+    async def voltage_limit(self):
+        return await self._get_float(self.__VOLTAGE_LIMIT_COMMAND)
+
+    # Coroutine - Set a new maximum voltage limit
+    async def set_voltage_limit(self, volts):
+        await self._set(self.__VOLTAGE_LIMIT_COMMAND, volts)
+
+    # Coroutine - What is the mimimum voltage limit?
+    async def voltage_minimum(self):
+        return await self._get_float(self.__VOLTAGE_MINIMUM_COMMAND)
+
+    # Coroutine - Set a new minimum voltage limit
+    async def set_voltage_minimum(self, volts):
+        await self._set(self.__VOLTAGE_MINIMUM_COMMAND, volts)
+
+
+    # Property - What is the current?
+    @property
+    def current(self):
+        return self.__current
+
+    # Coroutine - What is the current setpoint?
+    async def current_constant(self):
+        return self.__set_i
+
+    # Coroutine - Set a new current setpoint
+    async def set_current_constant(self, amps):
+        await self._set(self.__CONSTANT_CURRENT_COMMAND, amps)
+        self.__set_i = amps
+
+    # Coroutine - What is the maximum current limit?
+    async def current_limit(self):
+        return await self._get_float(self.__CURRENT_LIMIT_COMMAND)
+
+    # Coroutine - Set a new maximum current limit
+    async def set_current_limit(self, amps):
+        await self._set(self.__CURRENT_LIMIT_COMMAND, amps)
+
+
+    # Property - What is the power?
+    @property
+    def power(self):
+        return self.__power
+
+    # Coroutine - What is the power setpoint?
+    async def power_constant(self):
+        return self.__set_p
+
+    # Coroutine - Set a new power setpoint
+    async def set_power_constant(self, watts):
+        await self._set(self.__CONSTANT_POWER_COMMAND, watts)
+        self.__set_p = watts
+
+    # Coroutine - What is the maximum power limit?
+    async def power_limit(self):
+        return await self._get_float(self.__POWER_LIMIT_COMMAND)
+
+    # Coroutine - Set a new maximum power limit
+    async def set_power_limit(self, watts):
+        await self._set(self.__POWER_LIMIT_COMMAND, watts)
@@ -21,8 +21,14 @@
 #############################################################################
 
 ## Required imports
-import sys, os, time, argparse, select
-import loadbank, scheduler
+import sys, os, time, argparse, types
+import loadbank, scheduler, datalogger, binlog, ticker, metrics, perf, console, control, telemetry, energy
+
+# Recent sample statistics need numpy, carry on without them if it isn't installed
+try:
+    import history
+except ImportError:
+    history = None
 
 
 ## Function to print the header
@@ -53,45 +59,30 @@ def _parse_commandline():
     
     # Define aguments
     parser.add_argument('--out', type=str, default='', help='Save my data to USB stick')
+    parser.add_argument('--format', type=str, default='tsv', choices=['tsv', 'bin'], help='Logfile format, see binlog.py')
     parser.add_argument('--verbose', default=False, action='store_true', help='Print log to screen')
     parser.add_argument('--profile', type=str, default='', help='Name of flight profile file')
     parser.add_argument('--auto', default=False, action='store_true', help='Auto voltage hold')
+    parser.add_argument('--lookahead', default=False, action='store_true', help='Send profile setpoints early by the link latency')
+    parser.add_argument('--write-behind', default=False, action='store_true', help='Queue loadbank writes and send them in the background')
+    parser.add_argument('--rate', type=float, default=0.0, help='Loop rate in Hz, 0 to run flat out')
+    parser.add_argument('--catchup', default=False, action='store_true', help='Run late ticks back to back rather than skip them')
+    parser.add_argument('--metrics-port', type=int, default=0, help='Serve Prometheus metrics on this local port, 0 for off')
+    parser.add_argument('--profile-perf', default=False, action='store_true', help='Time each part of the loop, see perf.py')
+    parser.add_argument('--perf-window', type=float, default=10.0, help='Seconds of stack samples for a flame graph with --profile-perf, 0 for none')
+    parser.add_argument('--control-port', type=int, default=0, help='Serve JSON-RPC control on this local port, 0 for off')
+    parser.add_argument('--control-socket', type=str, default='', help='Serve JSON-RPC control on this Unix socket')
+    parser.add_argument('--telemetry-port', type=int, default=0, help='Stream samples as JSON lines on this local port, 0 for off')
+    parser.add_argument('--telemetry-udp', type=str, default=[], action='append', help='Send samples as JSON datagrams to host:port, can be repeated')
+    parser.add_argument('--history', type=int, default=100000, help='Recent samples kept for history statistics, 0 for none')
+    parser.add_argument('--host', type=str, default='158.125.152.225', help='Loadbank address')
+    parser.add_argument('--port', type=int, default=10001, help='Loadbank port')
+    parser.add_argument('--password', type=str, default='fuelcell', help='Loadbank password')
 
     # Return what was argued
     return parser.parse_args()
 
 
-## Function to read user input while running (stdin)
-def _reader():
-    # Get data from screen
-    __inputlist = [sys.stdin]
-
-    # Parse the typed in characters
-    while __inputlist:
-        __ready = select.select(__inputlist, [], [], 0.001)[0]
-
-        # If no data has been typed then return blank
-        if not __ready:
-            return ''
-            
-        # Otherwise parse line
-        else:
-            # Read the line
-            for __file in __ready:
-                __line = __file.readline()
-
-            # If there is nothing it is the end of the line
-            if not __line:
-               __inputlist.remove(__file)
-               
-            # Otherwise return line with no whitespace and all letters in lowercase
-            elif __line.rstrip():  # optional: skipping empty lines
-                return __line.lower().strip()
-                
-    # If we get here something went wrong so return blank
-    return ''
-
-
 ## Function to write list data
 def _writer(function, data):
     if type(data) is float:
@@ -139,12 +130,19 @@ def _print_help(destination):
                  "\t'i?'            [current]A\n",
                  "\t'p?'            [power]W\n",
                  "\t'elec?'         [mode setpoint voltage current power]\n",
+                 "\t'energy?'       [energy and charge taken so far]Wh Ah\n",
+                 "\t'energy reset'  [count from zero again]\n",
                  "\n",
                  "Loadbank control:\n",
                  "\t'v 1.5'         [set 1.5V]\n",
                  "\t'i 2.0'         [set 2.0A]\n",
                  "\t'load on'\n",
                  "\t'load off'\n",
+                 "\t'link?'         [connection state and outages]\n",
+                 "\t'stats?'        [latency, loop and logfile metrics]\n",
+                 "\t'perf?'         [time spent in each part of the loop]\n",
+                 "\t'history?'      [min max mean std rms over the last 60s]\n",
+                 "\t'history 10'    [the same over the last 10s]\n",
                  "\t'auto?'         [voltage controller state]\n",
                  "\t'auto on'       [turn voltage controller on]\n",
                  "\t'auto off'      [turn voltage controller off]\n",
@@ -155,6 +153,7 @@ def _print_help(destination):
                  "\t'profile on'    [start profile]\n",
                  "\t'profile pause' [pause profile]\n",
                  "\t'profile off'   [stop  profile]\n",
+                 "\t'edges?'        [estimated lookahead edge timing errors]\n",
                  "\n",
                  "*run commands can be stacked, eg:\n",
                  "\tpython3 main.py --verbose --out test1 --profile my_profile.txt\n\n"]
@@ -167,20 +166,26 @@ def _print_help(destination):
     return help_text
 
 
-## Function to print the time
-def _print_time(timeStart, destination, verbose=False):
-    # Get the time data
+## Function to get the time
+def _get_time(timeStart, verbose=False):
+    now = time.time()
     if verbose:
-        delta = [
-            "Epoch:",    time.time(),
-            "Duration:", time.time() - timeStart,
+        return [
+            "Epoch:",    now,
+            "Duration:", now - timeStart,
         ]
     else:
-        delta = [
-            time.time(),
-            time.time() - timeStart,
+        return [
+            now,
+            now - timeStart,
         ]
 
+
+## Function to print the time
+def _print_time(timeStart, destination, verbose=False):
+    # Get the time data
+    delta = _get_time(timeStart, verbose)
+
     # Write the data to destination
     for cell in delta:
         _writer(destination, cell)
@@ -189,8 +194,10 @@ def _print_time(timeStart, destination, verbose=False):
     return delta
 
 
-## Function to print the electrical data
-def _print_electric(load, destination, verbose=False):
+## Function to get the electrical data
+def _get_electric(load, verbose=False):
+    electric = []
+
     # If there is a digital loadbank connected get that data
     if load:
         if verbose:
@@ -204,19 +211,28 @@ def _print_electric(load, destination, verbose=False):
         else:
             # Convert mode to a code for Matlab compatibility
             if "CURRENT" in load.mode:
-                mode_code = "1\t" + load.mode.split()[1]
+                mode_code = ["1", load.mode.split()[1]]
             elif "VOLTAGE" in load.mode:
-                mode_code = "2\t" + load.mode.split()[1]
+                mode_code = ["2", load.mode.split()[1]]
             elif "POWER" in load.mode:
-                mode_code = "3\t" + load.mode.split()[1]
+                mode_code = ["3", load.mode.split()[1]]
             else:
-                mode_code = "999\t999"
+                mode_code = ["999", "999"]
 
             # Add the load data to the controller data
-            electric = [mode_code,
+            electric = mode_code + [
                         load.voltage,
                         load.current,
                         load.power]
+
+    # Return the data
+    return electric
+
+
+## Function to print the electrical data
+def _print_electric(load, destination, verbose=False):
+    # Get the electrical data
+    electric = _get_electric(load, verbose)
     
     # Write the data to destination
     for cell in electric:
@@ -226,6 +242,29 @@ def _print_electric(load, destination, verbose=False):
     return electric
 
 
+## Function to get the energy and charge taken so far
+def _get_energy(counter, verbose=False):
+    # Numbers for the logfile, text to 4 decimal places for the screen
+    if verbose:
+        return ["E_load:", "{0:.4f}".format(counter.watt_hours) + "Wh",
+                "Q_load:", "{0:.4f}".format(counter.amp_hours) + "Ah"]
+    else:
+        return [counter.watt_hours, counter.amp_hours]
+
+
+## Function to print the energy data
+def _print_energy(counter, destination, verbose=False):
+    # Get the energy data
+    totals = _get_energy(counter, verbose)
+
+    # Write the data to destination
+    for cell in totals:
+        _writer(destination, cell)
+
+    # Return the data
+    return totals
+
+
 ## Function to print the voltage data
 def _print_voltage(load, destination, verbose=False):
     # If there is a digital loadbank connected get that data
@@ -280,6 +319,261 @@ def _print_power(load, destination, verbose=False):
     return power
 
 
+## Function to send a setpoint for the mode the loadbank is in
+def _apply_setpoint(load, setpoint):
+    # Set the type of electrical profile we are running
+    mode = load.mode
+
+    # Set the setpoint for the electrical profile for now
+    if "VOLTAGE" in mode:
+        load.voltage_constant = str(setpoint)
+    elif "CURRENT" in mode:
+        load.current_constant = str(setpoint)
+    elif "POWER" in mode:
+        load.power_constant = str(setpoint)
+
+
+## Function to apply the profile setpoint, returns the auto voltage setpoint
+def _run_profile(profile, load, args, auto_voltage, lookahead=''):
+    try:
+        # Running
+        if profile.state == 1:
+            # Check if just [re]started
+            if profile.state_last != 1:
+                print("Turning loadbank on")
+                load.load = True
+
+            # Get the programmed setpoint
+            setpoint = profile.run()
+
+            # and the setpoint is not in an error mode...
+            if setpoint >= 0:
+
+                # Set the setpoint for the electrical profile for now
+                if args.auto:
+                    auto_voltage = float(setpoint)
+                elif lookahead:
+                    lookahead.step(setpoint)
+                else:
+                    _apply_setpoint(load, setpoint)
+
+        # Paused
+        elif profile.state == 2:
+            if profile.state_last == 1:
+                if lookahead: lookahead.cancel()
+                load.load = False
+                load.zero()
+                args.auto = False
+            pass
+        # Stopped
+        else:
+            if profile.state_last in (1, 2):
+                if lookahead: lookahead.cancel()
+                load.load = False
+                load.zero()
+                args.auto = False
+
+    except AttributeError:
+        print("No profile loaded. Restart the programme with --profile filename.txt")
+        raise SystemExit
+
+    return auto_voltage
+
+
+## Function to gather the loadbank, loop and logfile metrics
+def _metrics(load, log, loop_period):
+    stats = metrics.Metrics()
+    stats.histogram("loadbank_round_trip_seconds", "Query round trip time", lambda: load.round_trips, "command")
+    stats.counter("loadbank_timeouts_total", "Replies that did not arrive in time", lambda: load.timed_out, "command")
+    stats.counter("loadbank_resends_total", "Queries asked again", lambda: load.resends)
+    stats.counter("loadbank_suppressed_total", "Writes not sent as nothing changed", lambda: load.suppressed)
+    stats.counter("loadbank_bytes_out_total", "Bytes sent to the loadbank", lambda: load.bytes_out)
+    stats.counter("loadbank_bytes_in_total", "Bytes read from the loadbank", lambda: load.bytes_in)
+    stats.counter("loadbank_reconnects_total", "Reconnects after losing the link", lambda: load.reconnects)
+    stats.counter("loadbank_outage_seconds_total", "Time spent disconnected", lambda: load.outage_total)
+    stats.gauge("loadbank_connected", "1 if the link is up", lambda: int(load.connected))
+    stats.gauge("loadbank_latency_seconds", "Estimated one way link latency", lambda: load.latency)
+    stats.histogram("loop_period_seconds", "Time between main loop iterations", lambda: loop_period)
+    if log:
+        stats.gauge("log_queue_depth", "Records waiting to be written", lambda: log.depth)
+        stats.counter("log_dropped_total", "Records thrown away as the queue was full", lambda: log.dropped)
+        stats.counter("log_late_total", "Records that waited too long to be written", lambda: log.late)
+        stats.counter("log_written_total", "Records written", lambda: log.written)
+    return stats
+
+
+## Function to get what a print function writes as text
+def _show(function, *arguments, **keywords):
+    cells = []
+    function(*arguments, destination=lambda text, end='\n': cells.append(text + end), **keywords)
+    return ''.join(cells).rstrip('\t')
+
+
+## Function to describe the profile state
+def _profile_state(session):
+    if session.profile and session.profile.state == 1:
+        return "Profile running"
+    elif session.profile and session.profile.state == 2:
+        return "Profile paused"
+    return "Profile stopped"
+
+
+## Function to describe the connection
+def _link_state(session):
+    load = session.load
+    return (("Connected" if load.connected else "Disconnected for {0:.1f}s".format(load.outage))
+            + ", {0} outages, {1} reconnects, last {2:.1f}s, {3:.1f}s in total".format(
+                load.outages, load.reconnects, load.outage_last, load.outage_total))
+
+
+## Function to start, pause or stop the profile
+def _set_profile(session, argument):
+    if not session.profile:
+        raise ValueError("no profile loaded. Restart the programme with --profile filename.txt")
+    elif argument.startswith("on"):
+        state = 1
+    elif argument.startswith("pause"):
+        state = 2
+    elif argument.startswith("off"):
+        state = 0
+    else:
+        raise ValueError("unknown command '" + argument + "', try [on, pause, off]")
+
+    # The profile ignores a change that makes no sense now, eg. pausing when it isn't running
+    before = session.profile.state
+    session.profile.state = state
+    if session.profile.state == before:
+        raise ValueError("the profile can't go to '" + argument + "' from state " + str(before))
+
+
+## Function to describe the recent samples, over the last 60s unless argued
+def _history(session, argument=None):
+    if not session.recent:
+        raise ValueError("no history, needs numpy and --history above 0")
+    return session.recent.describe(float(argument) if argument else 60.0)
+
+
+## Function to start the energy and charge counters from zero
+def _set_energy(session, argument):
+    if not argument.startswith("reset"):
+        raise ValueError("unknown command '" + argument + "', try [reset]")
+    session.energy.reset()
+    return "Energy and charge counters reset"
+
+
+## Function to turn the voltage controller on or off
+def _set_auto(session, argument):
+    if argument.startswith("on"):
+        session.args.auto = True
+        session.auto_voltage = session.load.voltage
+    else:
+        session.args.auto = False
+
+
+## Function to set the voltage, or the voltage to hold if not in voltage mode
+def _set_voltage(session, argument):
+    float(argument)  # Raises ValueError so a bad value is never sent
+    if "VOLTAGE" in session.load.mode:
+        session.load.voltage_constant = str(argument)
+    else:
+        session.auto_voltage = float(argument)
+
+
+## Function to set the current
+def _set_current(session, argument):
+    float(argument)  # Raises ValueError so a bad value is never sent
+    session.load.current_constant = str(argument)
+
+
+## Function to turn the load on or off
+def _set_load(session, argument):
+    session.load.load = argument.startswith("on")
+
+
+# Commands asking for something, name: function(session) returning the text to show
+_QUERIES = {
+    "help":     lambda session: _show(_print_help),
+    "time?":    lambda session: _show(_print_time, session.timeStart, verbose=True),
+    "elec?":    lambda session: _show(_print_electric, session.load, verbose=True),
+    "v?":       lambda session: _show(_print_voltage, session.load, verbose=True),
+    "i?":       lambda session: _show(_print_current, session.load, verbose=True),
+    "p?":       lambda session: _show(_print_power, session.load, verbose=True),
+    "energy?":  lambda session: str(session.energy),
+    "stats?":   lambda session: str(session.stats),
+    "perf?":    lambda session: str(session.phases) if session.phases else "Loop timing off, restart with --profile-perf",
+    "link?":    _link_state,
+    "edges?":   lambda session: str(session.lookahead) if session.lookahead else "Lookahead off, restart with --lookahead",
+    "auto?":    lambda session: "Voltage controller set to " + str(session.auto_voltage) + "V",
+    "profile?": _profile_state,
+    "history?": _history,
+}
+
+# Commands changing something, name: function(session, argument) returning any text to show
+_SETTINGS = {
+    "profile": _set_profile,
+    "auto":    _set_auto,
+    "i":       _set_current,
+    "v":       _set_voltage,
+    "load":    _set_load,
+    "history": _history,
+    "energy":  _set_energy,
+}
+
+
+## Function to run a console command on the control loop
+def _dispatch(session, command):
+    # Skip a command whoever sent it has given up on
+    if command.claim and not command.claim.acquire(False):
+        return None
+
+    result = error = None
+    try:
+        if command.argument is None and command.name in _QUERIES:
+            result = _QUERIES[command.name](session)
+        elif command.argument is not None and command.name in _SETTINGS:
+            result = _SETTINGS[command.name](session, command.argument)
+        else:
+            error = "Unknown command '" + command.name + "', type 'help' for a list"
+    except (ValueError, loadbank.LoadbankError) as exception:
+        error = "Failed, " + str(exception)
+
+    # Answer whoever asked
+    if command.reply:
+        command.reply(result, error)
+    else:
+        if error or result:
+            print(error or result)
+        print()
+    return result
+
+
+## Function to read a logged cell as a number, None if it isn't one
+def _to_number(cell):
+    try:
+        return float(cell)
+    except (TypeError, ValueError):
+        return None
+
+
+## Function to describe the last sample for the control server
+def _sample(session, record):
+    return {
+        "time":         record[0],
+        "duration":     record[1],
+        "mode":         {"1": "CURRENT", "2": "VOLTAGE", "3": "POWER"}.get(record[2], ""),
+        "setpoint":     _to_number(record[3]) if record[2] != "999" else None,
+        "voltage":      record[4],
+        "current":      record[5],
+        "power":        record[6],
+        "watt_hours":   session.energy.watt_hours,
+        "amp_hours":    session.energy.amp_hours,
+        "auto":         session.args.auto,
+        "auto_voltage": session.auto_voltage,
+        "profile":      _profile_state(session),
+        "connected":    session.load.connected,
+    }
+
+
 ## Shutdown routine        
 def _shutdown(load, log):
     try:
@@ -287,12 +581,14 @@ def _shutdown(load, log):
 
         # Shutdown loadbank
         if load:
+            if load.write_behind:
+                print('...Loadbank writes ' + str(load.coalesced) + ' coalesced, ' + str(load.dropped) + ' dropped')
             print('...Loadbank disconnected')
             if load.shutdown(): print('Done\n')
         
         # Shutdown datalog
         if log:
-            print('...Datalogger closed')
+            print('...Datalogger closed, ' + str(log.dropped) + ' dropped, ' + str(log.late) + ' late')
             if log.close(): print('Done\n')
         
     except KeyboardInterrupt:        
@@ -317,7 +613,7 @@ if __name__ == "__main__":
         args = _parse_commandline()
 
         # Initialise Digital loadbank
-        load = loadbank.TdiLoadbank('158.125.152.225', 10001, 'fuelcell')
+        load = loadbank.TdiLoadbank(args.host, args.port, args.password)
 
         # If we cannot connect to the loadbank, quit
         if load.connect() == 0:
@@ -325,18 +621,20 @@ if __name__ == "__main__":
         # Otherwise zero it and set safety limits
         else:
             print("Setting up loadbank...")
-            mysleep = 0.4
             load.zero()
-            time.sleep(mysleep)
-            load.mode = "CURRENT"
-            time.sleep(mysleep)
-            load.range = "9" # 4
-            time.sleep(mysleep)
-            load.current_limit = "30.0" # 30.0
-            time.sleep(mysleep)
-            load.voltage_limit = "35.0" # 35.0
-            time.sleep(mysleep)
-            load.voltage_minimum = "0.01"#"1.2" # 5.0
+            try:
+                # Each setting is read back to check it took
+                load.setup([["mode", "CURRENT"],
+                            ["range", "9"], # 4
+                            ["current_limit", "30.0"], # 30.0
+                            ["voltage_limit", "35.0"], # 35.0
+                            ["voltage_minimum", "0.01"]]) #"1.2" # 5.0
+            except loadbank.LoadbankError as error:
+                print("Loadbank: " + str(error))
+                raise SystemExit
+
+            # Send setpoints in the background from here on if argued
+            load.write_behind = args.write_behind
 
         # Initialise profile scheduler if argued
         if args.profile:
@@ -352,14 +650,18 @@ if __name__ == "__main__":
         else:
             profile = ''
 
-        # If user asked for a logfile then open this
+        timeStart = time.time()
+
+        # If user asked for a logfile then open this, written in the background
         if args.out:
-            log = open(("/media/usb/" + time.strftime("%y%m%d-%H%M%S") + "-controller-" + args.out + ".tsv"), 'w')
-        # Otherwise open nothing to prevent errors
+            if args.format == 'bin':
+                log_format = binlog.BinaryFormat(timeStart)
+            else:
+                log_format = datalogger.TsvFormat()
+            log = datalogger.Datalogger("/media/usb/" + time.strftime("%y%m%d-%H%M%S") + "-controller-" + args.out + "." + args.format, fmt=log_format)
+        # Otherwise log nothing
         else:
-            log = open("/dev/null", 'w')
-
-        timeStart = time.time()
+            log = ''
 
         # Display a list of available user commands
         print("\n\nType command:\n"
@@ -367,177 +669,212 @@ if __name__ == "__main__":
             + "**Type 'help' for a full list**\n\n")
 
         flag = False
-        auto_voltage = 0.0
+
+        # Control loop state the console commands can see and change
+        session = types.SimpleNamespace(load=load, profile=profile, args=args, timeStart=timeStart,
+                                        auto_voltage=0.0, lookahead='', stats='', phases='', sample={},
+                                        energy=energy.Energy())
+
+        # Keep recent samples for the history statistics if argued and numpy is installed
+        if history and args.history > 0:
+            session.recent = history.History(args.history)
+        else:
+            session.recent = ''
+
+        # Send profile setpoints early by the link latency if argued
+        if profile and args.lookahead:
+            # Log each edge as [planned sent latency error setpoint], the error is estimated, see scheduler.Lookahead
+            if args.out:
+                edge_log = datalogger.Datalogger("/media/usb/" + time.strftime("%y%m%d-%H%M%S") + "-edges-" + args.out + ".tsv")
+                log_edge = lambda record: edge_log.write(["{0:.4f}".format(cell) for cell in record])
+            else:
+                edge_log = log_edge = ''
+            lookahead = scheduler.Lookahead(profile, lambda setpoint: _apply_setpoint(load, setpoint),
+                                            lambda: load.latency, log_edge or None)
+        else:
+            lookahead = edge_log = ''
+
+        # Run the loop at a fixed rate if argued
+        if args.rate:
+            tick = ticker.Ticker(args.rate, ticker.CATCH_UP if args.catchup else ticker.SKIP)
+        else:
+            tick = ''
+
+        # Keep metrics for 'stats?' and serve them locally if argued
+        loop_period = metrics.Histogram()
+        loop_last = None
+        stats = _metrics(load, log, loop_period)
+        if args.metrics_port:
+            stats_server = metrics.MetricsServer(stats, PORT=args.metrics_port)
+            print("Metrics on http://{0}:{1}/metrics".format(*stats_server.start()))
+        else:
+            stats_server = ''
+
+        # Time each part of the loop and sample the stack for a while if argued
+        if args.profile_perf:
+            phases = perf.Phases()
+            stats.histogram("loop_phase_seconds", "Time spent in each part of the loop", lambda: phases.phases, "phase")
+            if args.perf_window > 0:
+                sampler = perf.Sampler(args.perf_window)
+                sampler.start()
+            else:
+                sampler = ''
+        else:
+            phases = sampler = ''
+
+        session.lookahead, session.stats, session.phases = lookahead, stats, phases
+        stats.gauge("energy_watt_hours", "Energy taken since the start or last reset", lambda: session.energy.watt_hours)
+        stats.gauge("charge_amp_hours", "Charge taken since the start or last reset", lambda: session.energy.amp_hours)
+
+        # Read typed in commands in the background
+        terminal = console.Console()
+        terminal.start()
+
+        # Take the same commands over the network if argued
+        controls = []
+        if args.control_port:
+            controls.append(control.ControlServer(terminal.submit, lambda: session.sample, PORT=args.control_port))
+        if args.control_socket:
+            controls.append(control.UnixControlServer(terminal.submit, lambda: session.sample, args.control_socket))
+        for server in controls:
+            print("Control server on " + str(server.start()))
+
+        # Share each sample with dashboards and recorders if argued
+        publishers = []
+        if args.telemetry_port or args.telemetry_udp:
+            load.telemetry = telemetry.Bus()
+            stats.counter("telemetry_published_total", "Samples published", lambda: load.telemetry.published)
+            stats.counter("telemetry_dropped_total", "Samples thrown away by slow subscribers", lambda: load.telemetry.dropped)
+            stats.gauge("telemetry_subscribers", "Subscribers connected", lambda: load.telemetry.subscribers)
+        if args.telemetry_port:
+            publishers.append(telemetry.TelemetryServer(load.telemetry, PORT=args.telemetry_port))
+            print("Telemetry on " + str(publishers[-1].start()))
+        for address in args.telemetry_udp:
+            host, port = address.rsplit(':', 1)
+            publishers.append(telemetry.UdpPublisher(load.telemetry, host, int(port)))
 
 
         ### Main loop ###
         while True:
+            if phases: phases.start()
+
+            # Wait for the next tick, or until the profile setpoint changes
+            if tick:
+                if tick.wait(profile.next_change if profile else None) is None:
+                    # Woken up for the profile, apply the new setpoint right away
+                    if phases: phases.lap("wait")
+                    session.auto_voltage = _run_profile(profile, load, args, session.auto_voltage, lookahead)
+                    if phases: phases.lap("profile")
+                    continue
+                if phases: phases.lap("wait")
+
+            # Time between iterations
+            loop_now = time.monotonic()
+            if loop_last is not None:
+                loop_period.observe(loop_now - loop_last)
+            loop_last = loop_now
+
             # Handle the loadbank
+            sampled_at = None
             if load:
-                load.update()
-
+                try:
+                    load.update()
+                    sampled_at = time.monotonic()
+                    session.energy.add(sampled_at, load.current, load.power)
+                except loadbank.LoadbankDisconnected:
+                    session.energy.interrupt()  # The loadbank says when it is lost and back
+                except loadbank.LoadbankError as error:
+                    session.energy.interrupt()
+                    print("Loadbank: " + str(error))
+            if phases: phases.lap("update")
 
             ## Handle the voltage controller
             if args.auto:
                 if not flag:
                     time.sleep(1)
-                    auto_voltage = load.voltage
-                    print("Set voltage hold to " + str(auto_voltage) +"V")
+                    session.auto_voltage = load.voltage
+                    print("Set voltage hold to " + str(session.auto_voltage) +"V")
                     load.load = True
                     flag = True
                 else:
-                    if load.load:  
-                        load.current_constant = str(_voltage_controller(load.voltage, auto_voltage, float(load.current_constant)))
+                    try:
+                        if load.load:  
+                            load.current_constant = str(_voltage_controller(load.voltage, session.auto_voltage, float(load.current_constant)))
+                    except loadbank.LoadbankDisconnected:
+                        pass  # Hold the last setpoint until reconnected
+                    except loadbank.LoadbankError as error:
+                        print("Loadbank: " + str(error))  # Hold the last setpoint, try again next time
             else:
                 if flag:
                     load.load = False
                     load.zero()
                     flag = False
+            if phases: phases.lap("auto")
 
 
             ## Handle the profile
             if profile:
-                try:
-                    # Running
-                    if profile.state is 1:
-                        # Check if just [re]started
-                        if profile.state_last is not 1:
-                            print("Turning loadbank on")
-                            load.load = True
-
-                        # Get the programmed setpoint
-                        setpoint = profile.run()
-
-                        # and the setpoint is not in an error mode...
-                        if setpoint >= 0:
-                            
-                            # Set the type of electrical profile we are running
-                            mode = load.mode
-                            
-                            # Set the setpoint for the electrical profile for now
-                            if args.auto:
-                                auto_voltage = float(setpoint)
-                            elif "VOLTAGE" in mode:
-                                load.voltage_constant = str(setpoint)
-                            elif "CURRENT" in mode:
-                                load.current_constant = str(setpoint)
-                            elif "POWER" in mode:
-                                load.power_constant = str(setpoint)
-
-                    # Paused
-                    elif profile.state is 2:
-                        if profile.state_last is 1:
-                            load.load = False
-                            load.zero()
-                            args.auto = False
-                        pass
-                    # Stopped
-                    else:
-                        if profile.state_last in (1, 2):
-                            load.load = False
-                            load.zero()
-                            args.auto = False
-                    
-                except AttributeError:
-                    print("No profile loaded. Restart the programme with --profile filename.txt")
-                    break
+                session.auto_voltage = _run_profile(profile, load, args, session.auto_voltage, lookahead)
+            if phases: phases.lap("profile")
 
 
             ## Handle the logfile
-            # Log time
-            _print_time(timeStart, log.write)
-        
-            # Log electrical data
-            electric = _print_electric(load, log.write)
-                
-            # Log a new line, end of this timestep
+            # Log time, electrical data and the totals as one record, written in the background
+            record = _get_time(timeStart) + _get_electric(load) + _get_energy(session.energy)
             if log:
-                log.write("\n")
+                log.write(record)
+            if controls:
+                session.sample = _sample(session, record)
+            if session.recent and sampled_at:
+                session.recent.append(sampled_at, [_to_number(record[3]) if record[2] != "999" else None,
+                                                 load.voltage, load.current, load.power])
+            if phases: phases.lap("log")
         
             # If verbose is argued then print all data to screen
-            if args.verbose and not args.timer:
-                _print_time(timeStart, print)
-                _print_electric(load, print)
+            if args.verbose:
+                for cell in record[:-2]:
+                    _writer(print, cell)
+                for cell in record[-2:]:  # The totals to 4 decimal places, they grow slowly
+                    _writer(print, "{0:.4f}".format(cell))
                 print()
+            if phases: phases.lap("print")
 
 
             ## Handle the user interface
-            # Read typed in user data on the screen
-            request = _reader()
-
-            # If something was typed in...
-            if request:
-                    
-                # Split the argument from the value
-                request = request.split(' ')
-                    
-                # Determine the number of pieces of information
-                req_len = len(request)
-                    
-                # Strip away any whitespace
-                for x in range(req_len):
-                    request[x] = request[x].strip()
-        
-                # If only one piece of information, it is a request for data
-                if req_len is 1:
-                    if request[0].startswith("help"):
-                        _print_help(print)
-                    elif request[0].startswith("time?"):
-                        _print_time(timeStart, print, True)
-                    elif request[0].startswith("elec?"):
-                        _print_electric(load, print, True)
-                    elif request[0].startswith("v?"):
-                        _print_voltage(load, print, True)
-                    elif request[0].startswith("i?"):
-                        _print_current(load, print, True)
-                    elif request[0].startswith("p?"):
-                        _print_power(load, print, True)
-                    elif request[0].startswith("auto?"):
-                        print("Voltage controller set to " + str(auto_voltage) + "V")
-                    elif request[0].startswith("profile?"):
-                        if profile and profile.state is 1:
-                            print("Profile running")
-                        elif profile and profile.state is 2:
-                            print("Profile paused")
-                        else:
-                            print("Profile stopped")
-        
-                # If there are two pieces of information it is a command to change something
-                elif req_len is 2:
-                    if request[0].startswith("profile"):
-                        if not profile: print("No profile loaded. Restart the programme with --profile filename.txt")
-                        elif request[1].startswith("on"):
-                            profile.state = 1
-                        elif request[1].startswith("pause"):
-                            profile.state = 2
-                        elif request[1].startswith("off"):
-                            profile.state = 0
-                        else:
-                            print("Unknown command '" + request[1] + "', try [on, pause, off]")
-                    elif request[0].startswith("auto"):
-                        if request[1].startswith("on"):
-                            args.auto = True
-                            auto_voltage = load.voltage
-                        else:
-                            args.auto = False
-                    elif request[0].startswith("i"):
-                        load.current_constant = str(request[1])
-                    elif request[0].startswith("v"):
-                        if "VOLTAGE" in load.mode:
-                            load.voltage_constant = str(request[1])
-                        else:
-                            auto_voltage = float(request[1])
-                    elif request[0].startswith("load"):
-                        if request[1].startswith("on"):
-                            load.load = True
-                        else:
-                            load.load = False
-        
-                # Print a new line to the screen
-                print()
+            # Run whatever was typed in since the last tick
+            for command in terminal.ready():
+                _dispatch(session, command)
+            if phases: phases.lap("console")
 
     except (SystemExit, KeyboardInterrupt):
         print("Shutting down programme")
+        try:
+            if tick: print(tick)
+        except NameError: pass
+        try:
+            if lookahead:
+                lookahead.cancel()
+                print(lookahead)
+            if edge_log: edge_log.close()
+        except NameError: pass
+        try:
+            if stats_server: stats_server.stop()
+            for server in controls: server.stop()
+            for publisher in publishers: publisher.stop()
+        except NameError: pass
+        try:
+            print("Energy taken " + str(session.energy))
+        except NameError: pass
+        try:
+            if phases: print(phases)
+            if sampler:
+                sampler.stop()
+                if args.out:
+                    perf_file = "/media/usb/" + time.strftime("%y%m%d-%H%M%S") + "-perf-" + args.out + ".folded"
+                else:
+                    perf_file = time.strftime("%y%m%d-%H%M%S") + "-perf.folded"
+                print(str(sampler.write(perf_file)) + " stack samples saved to " + perf_file)
+        except NameError: pass
         try: _shutdown(load, log)
         except NameError: pass
         sys.exit()
@@ -0,0 +1,232 @@
+#!/usr/bin/python3
+
+# Metrics for the TDi Loadbank Controller
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Metrics are read when asked for, so keeping them costs nothing beyond the
+# counters themselves, eg:
+#     stats = metrics.Metrics()
+#     stats.counter("loadbank_resends_total", "Queries asked again", lambda: load.resends)
+#     print(stats)                        # Summary for the 'stats?' command
+#     metrics.MetricsServer(stats).start()  # Prometheus text on http://127.0.0.1:9464/metrics
+
+# Import libraries
+import bisect, http.server, threading
+
+
+# Histogram bucket upper bounds in seconds, from a fast query to a slow reconnect
+LATENCY_BOUNDS = (0.0005, 0.00075, 0.001, 0.0015, 0.002, 0.003, 0.005, 0.0075,
+                  0.01, 0.015, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75,
+                  1.0, 1.5, 2.0, 3.0, 5.0)
+
+
+# Define class
+class Histogram():
+    # Code to run when class is created, bounds are the bucket upper limits in order
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.__bounds = tuple(bounds)
+        self.__counts = [0] * (len(self.__bounds) + 1)  # The last bucket is everything bigger
+        self.__count = 0
+        self.__sum = 0.0
+        self.__min = float('inf')
+        self.__max = float('-inf')
+
+    # Method to add a value
+    def observe(self, value):
+        self.__counts[bisect.bisect_left(self.__bounds, value)] += 1
+        self.__count += 1
+        self.__sum += value
+        if value < self.__min:
+            self.__min = value
+        if value > self.__max:
+            self.__max = value
+
+    # Method to estimate a quantile, interpolating within the bucket it falls in
+    # The bucket is narrowed to the smallest and largest values seen, so a tight spread reads true
+    def quantile(self, fraction):
+        if not self.__count:
+            return 0.0
+        wanted = fraction * self.__count
+        total = 0
+        lower = 0.0
+        for upper, count in zip(self.__bounds + (float('inf'),), self.__counts):
+            if count and total + count >= wanted:
+                low, high = max(lower, self.__min), min(upper, self.__max)
+                return low + (high - low) * max(0.0, wanted - total) / count
+            total += count
+            lower = upper
+        return self.__max
+
+    # Property - Bucket upper bounds
+    @property
+    def bounds(self):
+        return self.__bounds
+
+    # Property - How many values fell in each bucket, the last one is above every bound
+    @property
+    def counts(self):
+        return list(self.__counts)
+
+    # Property - How many values have been added?
+    @property
+    def count(self):
+        return self.__count
+
+    # Property - Total of every value added
+    @property
+    def sum(self):
+        return self.__sum
+
+    # Property - Smallest value added, 0 if none
+    @property
+    def min(self):
+        return self.__min if self.__count else 0.0
+
+    # Property - Largest value added, 0 if none
+    @property
+    def max(self):
+        return self.__max if self.__count else 0.0
+
+    # Property - Average value
+    @property
+    def mean(self):
+        return self.__sum / self.__count if self.__count else 0.0
+
+
+# Function to write a Prometheus label set
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, value) for name, value in labels) + '}'
+
+
+# Function to write a Prometheus number
+def _number(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Define class
+class Metrics():
+    # Code to run when class is created, prefix goes on every metric name
+    def __init__(self, prefix="tdi_"):
+        self.__prefix = prefix
+        self.__families = []  # [name, type, help, read, label]
+
+    # Method to add a count that only goes up
+    # read returns a number, or {label value: number} if label is given
+    def counter(self, name, help, read, label=None):
+        self.__families.append([self.__prefix + name, "counter", help, read, label])
+
+    # Method to add a value that goes up and down
+    def gauge(self, name, help, read, label=None):
+        self.__families.append([self.__prefix + name, "gauge", help, read, label])
+
+    # Method to add a Histogram, read returns one or {label value: Histogram}
+    def histogram(self, name, help, read, label=None):
+        self.__families.append([self.__prefix + name, "histogram", help, read, label])
+
+    # Method to read every metric, yields [name, type, help, [(labels, value)]]
+    def _read(self):
+        for name, kind, help, read, label in self.__families:
+            value = read()
+            if label is None:
+                samples = [((), value)]
+            else:
+                samples = [(((label, key),), value[key]) for key in sorted(value)]
+            yield name, kind, help, samples
+
+    # Method to write every metric in the Prometheus text format
+    def render(self):
+        lines = []
+        for name, kind, help, samples in self._read():
+            lines.append("# HELP " + name + " " + help)
+            lines.append("# TYPE " + name + " " + kind)
+            for labels, value in samples:
+                if kind != "histogram":
+                    lines.append(name + _labels(labels) + " " + _number(value))
+                    continue
+
+                # Histogram buckets count everything up to their bound
+                total = 0
+                for bound, count in zip(value.bounds + (float('inf'),), value.counts):
+                    total += count
+                    lines.append(name + "_bucket" + _labels(labels + (("le", _number(bound)),)) + " " + str(total))
+                lines.append(name + "_sum" + _labels(labels) + " " + _number(value.sum))
+                lines.append(name + "_count" + _labels(labels) + " " + str(value.count))
+        return '\n'.join(lines) + '\n'
+
+    # Method to describe every metric on one line each, for the 'stats?' command
+    def __str__(self):
+        lines = []
+        for name, kind, help, samples in self._read():
+            for labels, value in samples:
+                if kind == "histogram":
+                    text = "n {0} mean {1:.2f}ms p50 {2:.1f}ms p99 {3:.1f}ms".format(
+                        value.count, 1000 * value.mean, 1000 * value.quantile(0.5), 1000 * value.quantile(0.99))
+                elif isinstance(value, float):
+                    text = "{0:.3f}".format(value)
+                else:
+                    text = str(value)
+                lines.append(name[len(self.__prefix):] + _labels(labels) + "\t" + text)
+        return '\n'.join(lines)
+
+
+# Define class
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # Method to answer a GET with the metrics
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Method to keep requests off the console
+    def log_message(self, format, *args):
+        pass
+
+
+# Define class
+class MetricsServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Code to run when class is created, serves on localhost only by default
+    def __init__(self, metrics, HOST='127.0.0.1', PORT=9464):
+        super().__init__((HOST, PORT), _Handler)
+        self.metrics = metrics
+        self.__thread = None
+
+    # Method to serve in the background, returns (host, port)
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, name="metrics", daemon=True)
+        self.__thread.start()
+        return self.server_address[:2]
+
+    # Method to stop serving
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.__thread:
+            self.__thread.join()
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+
+# Performance profiling for the TDi Loadbank Controller main loop
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Only used with python3 main.py --profile-perf, nothing here runs otherwise.
+#
+# Phases times each part of a loop iteration:
+#     phases.start()
+#     load.update();  phases.lap("update")
+#     ...
+#
+# Sampler records the main thread's stack every millisecond for a while and
+# writes it in the collapsed format flame graph tools read, eg:
+#     flamegraph.pl 180101-120000-perf-test.folded > perf.svg
+
+# Import libraries
+import collections, os.path, sys, threading, time
+import metrics
+
+
+# Define class
+class Phases():
+    # Code to run when class is created
+    def __init__(self, clock=time.perf_counter):
+        self.__clock = clock
+        self.__last = None
+        self.__phases = {}  # {phase name: metrics.Histogram}, in the order first seen
+
+    # Method to mark the start of an iteration
+    def start(self):
+        self.__last = self.__clock()
+
+    # Method to time the phase that just finished, since start or the last lap
+    def lap(self, phase):
+        now = self.__clock()
+        if self.__last is not None:
+            if phase not in self.__phases:
+                self.__phases[phase] = metrics.Histogram()
+            self.__phases[phase].observe(now - self.__last)
+        self.__last = now
+
+    # Property - Time of each phase, {phase name: metrics.Histogram}
+    @property
+    def phases(self):
+        return self.__phases
+
+    # Method to describe where the time goes
+    def __str__(self):
+        total = sum(histogram.sum for histogram in self.__phases.values()) or 1.0
+        return '\n'.join("{0:10s} mean {1:7.3f}ms  p99 {2:6.1f}ms  {3:5.1f}% of loop time".format(
+                             phase, 1000 * histogram.mean, 1000 * histogram.quantile(0.99),
+                             100 * histogram.sum / total)
+                         for phase, histogram in self.__phases.items())
+
+
+# Function to name a stack frame for the flame graph
+def _frame_name(frame):
+    code = frame.f_code
+    return os.path.basename(code.co_filename) + ":" + code.co_name
+
+
+# Define class
+class Sampler():
+    # Code to run when class is created
+    # Samples the calling thread every interval seconds for duration seconds
+    # Keeps at most stacks different stacks so memory stays bounded
+    def __init__(self, duration=10.0, interval=0.001, stacks=10000):
+        self.__duration = duration
+        self.__interval = interval
+        self.__stacks = stacks
+        self.__target = threading.get_ident()
+        self.__counts = collections.Counter()  # {"a;b;c": samples}
+        self.__samples = 0
+        self.__running = False
+        self.__thread = None
+
+    # Method to start sampling in the background
+    def start(self):
+        self.__running = True
+        self.__thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self.__thread.start()
+
+    # Method to take samples until the window closes
+    def _run(self):
+        end = time.monotonic() + self.__duration
+        while self.__running and time.monotonic() < end:
+            frame = sys._current_frames().get(self.__target)
+            if frame is None:
+                break
+
+            # Walk from the innermost call out, then flip it to read root first
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            if key in self.__counts or len(self.__counts) < self.__stacks:
+                self.__counts[key] += 1
+                self.__samples += 1
+
+            time.sleep(self.__interval)
+        self.__running = False
+
+    # Method to stop sampling early
+    def stop(self):
+        self.__running = False
+        if self.__thread:
+            self.__thread.join()
+
+    # Method to write the collapsed stacks, one "root;...;leaf count" per line
+    def write(self, filename):
+        with open(filename, 'w') as fid:
+            for stack, count in sorted(self.__counts.items()):
+                fid.write(stack + " " + str(count) + "\n")
+        return self.__samples
+
+    # Property - Is it still sampling?
+    @property
+    def running(self):
+        return self.__running
+
+    # Property - How many samples have been taken?
+    @property
+    def samples(self):
+        return self.__samples
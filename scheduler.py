@@ -20,22 +20,269 @@
 #############################################################################
 
 # Import libraries
-import time, os.path
+import time, os.path, bisect, mmap, re, threading, collections
+from array import array
+
+
+# Profiles bigger than this are memory mapped rather than read in
+LAZY_SIZE = 32 * 1024 * 1024
+
+
+# Start of any line that doesn't look like "time setpoint", checked with _parse as
+# this lets through a few it would take, eg. "inf 0"
+_NOT_A_ROW = re.compile(rb'^(?![ \t]*[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+                        rb'[ \t]+[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?=\s|$))', re.MULTILINE)
+
+
+# Function to read a "time setpoint" line, None if it isn't one
+def _parse(line):
+    try:
+        row = line.split()
+        return float(row[0]), float(row[1])
+    except (IndexError, ValueError):
+        return None
+
+
+# Profile read into memory once, times and setpoints in contiguous arrays
+class _Profile():
+    # Code to run when class is created
+    def __init__(self, filename):
+        self.times = array('d')
+        self.setpoints = array('d')
+
+        # The profile ends at the first line that isn't "time setpoint"
+        with open(filename) as fid:
+            for line in fid:
+                row = _parse(line)
+                if row is None:
+                    break
+                self.times.append(row[0])
+                self.setpoints.append(row[1])
+
+    # Method to find the row in force at a time, None if the profile is over
+    # Each row holds its setpoint until its time, so this is the first row after the time
+    def find(self, psuedo_time, hint=None):
+        times = self.times
+        index = None
+
+        # Usually we have only moved on a row or two so walk forward from the hint
+        if hint is not None and (hint == 0 or times[hint - 1] <= psuedo_time):
+            for n in range(hint, min(hint + 8, len(times))):
+                if times[n] > psuedo_time:
+                    index = n
+                    break
+
+        # Otherwise binary search
+        if index is None:
+            index = bisect.bisect_right(times, psuedo_time)
+        return index if index < len(times) else None
+
+    # Method to get the row after a row, None at the end
+    def following(self, cursor):
+        return cursor + 1 if cursor + 1 < len(self.times) else None
+
+    # Method to get the time a row ends
+    def time(self, cursor):
+        return self.times[cursor]
+
+    # Method to get the setpoint of a row
+    def setpoint(self, cursor):
+        return self.setpoints[cursor]
+
+    # Property - How long is the profile?
+    @property
+    def duration(self):
+        return self.times[-1] if self.times else 0.0
+
+
+# Profile read straight from a memory mapped file as it plays
+# Rows are found by binary search on byte offsets, which works because time
+# only goes forwards, helped by a sparse index of times seen so far
+# Like _Profile it ends at the first line that isn't "time setpoint", the lines
+# before a row are checked the first time it is found
+class _MappedProfile():
+    # Code to run when class is created
+    def __init__(self, filename, release=16 * 1024 * 1024, index_size=4096):
+        self.__fid = open(filename, 'rb')
+        self.__data = mmap.mmap(self.__fid.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(filename) else b''
+        self.__end = len(self.__data)
+        self.__release = release  # Bytes played before we let the pages go
+        self.__released = 0
+        self.__index_size = index_size  # Most entries in the sparse index
+        self.__index_times = []
+        self.__index_offsets = []
+        self.__rows = {}  # The few rows around the cursor, {offset: [time, setpoint, next offset]}
+        self.__cursor = None  # Last row found
+        self.__floor = float('-inf')  # Time the last row found started
+        self.__checked = 0  # Every line starting before this is a row
+
+    # Method to read the row starting at an offset, [time, setpoint, next offset] or None
+    def _row(self, offset):
+        row = self.__rows.get(offset)
+        if row is None:
+            if offset >= self.__end:
+                return None
+            end = self.__data.find(b'\n', offset)
+            end = self.__end if end < 0 else end + 1
+            parsed = _parse(self.__data[offset:end])
+            if parsed is None:
+                return None
+            row = [parsed[0], parsed[1], end]
+
+            # Only keep the last few rows
+            if len(self.__rows) > 16:
+                self.__rows.clear()
+            self.__rows[offset] = row
+        return row
+
+    # Method to find the first line starting at or after an offset
+    def _line_start(self, offset):
+        if offset <= 0:
+            return 0
+        start = self.__data.find(b'\n', offset - 1)
+        return self.__end if start < 0 else start + 1
+
+    # Method to check every line starting before an offset is a row, the profile is
+    # cut short at the first that isn't, returns False if it now ends before the offset
+    def _check(self, offset):
+        stop = min(self._line_start(offset), self.__end)
+        while self.__checked < stop:
+            # Scan in C for anything suspect, only whole lines as stop is a line start
+            match = _NOT_A_ROW.search(self.__data, self.__checked, stop)
+            if match is None or match.start() >= stop:
+                self.__checked = stop
+                break
+            line = match.start()
+            if self._row(line) is None:
+                self._cut(line)
+                break
+            self.__checked = self._line_start(line + 1)
+        return offset < self.__end
+
+    # Method to end the profile at an offset, forgetting anything seen after it
+    def _cut(self, offset):
+        self.__end = offset
+        self.__rows.clear()
+        keep = bisect.bisect_left(self.__index_offsets, offset)
+        del self.__index_times[keep:], self.__index_offsets[keep:]
+        if self.__cursor is not None and self.__cursor >= offset:
+            self.__cursor, self.__floor = None, float('-inf')
+
+    # Method to note a time and offset in the sparse index
+    def _remember(self, time_, offset):
+        if len(self.__index_times) < self.__index_size:
+            n = bisect.bisect_left(self.__index_times, time_)
+            if n >= len(self.__index_times) or self.__index_offsets[n] != offset:
+                self.__index_times.insert(n, time_)
+                self.__index_offsets.insert(n, offset)
+
+    # Method to find the row in force at a time, None if the profile is over
+    def find(self, psuedo_time, hint=None):
+        # Usually we have only moved on a row or two so walk forward from the last row
+        if hint is not None and hint == self.__cursor and self.__floor <= psuedo_time:
+            floor = self.__floor
+            for n in range(8):
+                row = self._row(hint)
+                if row is None:
+                    return None
+                if row[0] > psuedo_time:
+                    if self._check(hint + 1):
+                        return self._found(hint, floor)
+                    break
+                floor, hint = row[0], row[2]
+
+        # Otherwise narrow down with what we have seen so far
+        n = bisect.bisect_right(self.__index_times, psuedo_time)
+        low = self.__index_offsets[n - 1] if n > 0 else 0
+        high = self.__index_offsets[n] if n < len(self.__index_offsets) else self.__end
+        floor = float('-inf')
+
+        # Then binary search for the first row ending after the time
+        while low < high:
+            middle = self._line_start((low + high) // 2)
+            if middle >= high:
+                middle = low
+            row = self._row(middle)
+            if row is None or row[0] > psuedo_time:
+                high = middle
+            else:
+                floor, low = row[0], row[2]
+            if row is not None:
+                self._remember(row[0], middle)
+
+        if self._row(high) is None:
+            return None
+
+        # A line before it isn't a row, so the profile ends sooner, search again
+        if not self._check(high + 1):
+            return self.find(psuedo_time)
+        return self._found(high, floor)
+
+    # Method to remember the row found and the time before it started
+    def _found(self, cursor, floor):
+        self.__cursor, self.__floor = cursor, floor
+        self._let_go(cursor)
+        return cursor
+
+    # Method to let the pages we have played go, keeping memory use bounded
+    def _let_go(self, offset):
+        if offset - self.__released >= 2 * self.__release and hasattr(mmap, 'MADV_DONTNEED'):
+            start = (self.__released // mmap.PAGESIZE) * mmap.PAGESIZE
+            stop = ((offset - self.__release) // mmap.PAGESIZE) * mmap.PAGESIZE
+            if stop > start:
+                self.__data.madvise(mmap.MADV_DONTNEED, start, stop - start)
+                self.__released = stop
+
+    # Method to get the row after a row, None at the end
+    def following(self, cursor):
+        following = self._row(cursor)[2]
+        return following if self._row(following) is not None else None
+
+    # Method to get the time a row ends
+    def time(self, cursor):
+        return self._row(cursor)[0]
+
+    # Method to get the setpoint of a row
+    def setpoint(self, cursor):
+        return self._row(cursor)[1]
+
+    # Property - How long is the profile?
+    @property
+    def duration(self):
+        # Find where the profile really ends, then the last row is just before it
+        self._check(self.__end)
+        if self.__end:
+            start = self.__data.rfind(b'\n', 0, self.__end - 1) + 1
+            row = self._row(start)
+            if row is not None:
+                return row[0]
+        return 0.0
+
+    # Method to close the file
+    def close(self):
+        if self.__end:
+            self.__data.close()
+        self.__fid.close()
 
 
 # Define class
 class Scheduler():
     # Code to run when class is created
-    def __init__(self, filename):
+    # lazy memory maps the profile rather than reading it in, None decides on size
+    def __init__(self, filename, lazy=None):
         self.__filename = filename
         if os.path.isfile(filename):
             self.__filename = filename
         else:
             print("\nInvalid profile filename\n")
             raise SystemExit
-        self.__last_line = ''
-        self.__this_line = ''
-        self.__start_time = time.time()
+        if lazy is None:
+            lazy = os.path.getsize(filename) > LAZY_SIZE
+        self.__profile = _MappedProfile(filename) if lazy else _Profile(filename)
+        self.__cursor = None
+        self.__change_at = float('-inf')  # Psuedo time the setpoint next changes
+        self.__next_setpoint = -1
+        self.__start_time = time.monotonic()
         self.__running = 0
         self.__setpoint = 0
         self.__setpoint_last = -1
@@ -43,53 +290,69 @@ class Scheduler():
         self.__paused_at = 0.0
         self.__state = 0
         self.__state_last = 0
-	
-    # Method to read a line
-    def _get_line(self, pointer=1):
-        # If we want to re-read the last line...
-        if pointer is -1:
-            # Move the cursor backwards to the start of the last line
-            self.__fid.seek( self.__fid.tell() - len(self.__this_line) )
-            
-        # Save our last line
-        self.__last_line = self.__this_line
-        
-        # Update our current line
-        self.__this_line = self.__fid.readline()
-
-        # Return the line as single row of columns
-        return list( map(float,self.__this_line.split()) )
 
     # Method to find the setpoint relative to system time
     def _find_now(self):
         # Calculate time since start of schedule
         psuedo_time = self._get_psuedo_time()
-        
-        # Check if the current setpoint has expired
-        try:
-            if list( map(float,self.__this_line.split()) )[0] > psuedo_time:
-                # If it hasn't expired, return this setpoint
-                return list( map(float,self.__this_line.split()) )[1]
-                
-        # If there is an IndexError it is the first record so ignore
-        except (IndexError):
-            pass
-        
-        # The current setpoint has expired so get the next one
-        try:
-           x = self._get_line()
-           
-           # Find the next non-expired setpoint
-           while float(x[0]) < psuedo_time:
-               x = self._get_line()
-               pass  # Check next line
-           
-        # An exception of these types means end of test
-        except (IndexError, ValueError):
+
+        # Nothing to do until the setpoint changes
+        if psuedo_time < self.__change_at:
+            return self.__profile.setpoint(self.__cursor)
+
+        # Find the row in force now, starting from where we were
+        self.__cursor = self.__profile.find(psuedo_time, self.__cursor)
+
+        # Past the last row means end of test
+        if self.__cursor is None:
+            self.__change_at = float('-inf')
             return -1
-            
-        # Return this new unexpired setpoint
-        return x[1]
+
+        # Work out when this setpoint ends
+        self.__change_at = self._find_change()
+
+        # Return this unexpired setpoint
+        return self.__profile.setpoint(self.__cursor)
+
+    # Method to find the psuedo time the setpoint in force next changes
+    # Rows repeating the same setpoint are skipped, a long run is cut short
+    def _find_change(self):
+        profile, cursor = self.__profile, self.__cursor
+        setpoint = profile.setpoint(cursor)
+        following = None
+        for n in range(1000):
+            following = profile.following(cursor)
+            if following is None or profile.setpoint(following) != setpoint:
+                break
+            cursor = following
+
+        # Remember what comes next, -1 for the end of the profile
+        self.__next_setpoint = profile.setpoint(following) if following is not None else -1
+        return profile.time(cursor)
+
+    # Property - The setpoint after the next change, -1 at the end of the profile
+    @property
+    def next_setpoint(self):
+        return self.__next_setpoint
+
+    # Property - Monotonic time the setpoint next changes, None if not running
+    @property
+    def next_change(self):
+        if self.__state != 1:
+            return None
+        return self.__start_time + self.__paused_time + self.__change_at
+
+    # Method to jump to a time in the profile
+    def seek(self, psuedo_time):
+        now = self.__paused_at if self.__state == 2 else time.monotonic()
+        self.__start_time = now - self.__paused_time - psuedo_time
+        self.__cursor = self.__profile.find(psuedo_time)
+        self.__change_at = float('-inf')
+
+    # Property - How long is the profile?
+    @property
+    def duration(self):
+        return self.__profile.duration
 
     # Property - Is the schedule currently running?
     @property
@@ -126,15 +389,13 @@ class Scheduler():
         # Tell the user we are trying to start
         print("Starting the profile...", end="")
         
-        # Open the profile file
-        try:
-            self.__fid = open(self.__filename)
-        except IOError:
-            print("Can't open profile file!")
-            raise SystemExit
+        # Start from the top of the profile
+        self.__cursor = None
+        self.__change_at = float('-inf')
         
         # Set the schedule start time
-        self.__start_time = time.time()
+        self.__start_time = time.monotonic()
+        self.__paused_time = 0.0
         
         # Put the setpoint to zero for safety
         self.__setpoint = 0
@@ -147,12 +408,12 @@ class Scheduler():
     # Method to pause the profile
     def _pause(self):
         if self.__state is 2:
-            paused_for = time.time() - self.__paused_at - 0.00015 # [Crudely] Calibrated for average CPU time
+            paused_for = time.monotonic() - self.__paused_at - 0.00015 # [Crudely] Calibrated for average CPU time
             self.__paused_time = self.__paused_time + paused_for
             print("...unpaused after " + str("{0:.1f}".format(round(paused_for,2))) + "s, continuing from " + str("{0:.2f}".format(round(self._get_psuedo_time(),2))) + "s")
             return 1
         elif self.__state is 1:
-            self.__paused_at = time.time()
+            self.__paused_at = time.monotonic()
             print("Paused at " + str("{0:.2f}".format(round(self._get_psuedo_time(),2))) + "s,")
             print("Use 'profile pause' again to continue...")
             return 2
@@ -162,7 +423,7 @@ class Scheduler():
 
     # Calculate psuedo time. Time since start not including pauses
     def _get_psuedo_time(self):
-        return time.time() - self.__start_time - self.__paused_time
+        return time.monotonic() - self.__start_time - self.__paused_time
 
     # Method to stop the scheduler
     def _stop(self):
@@ -172,9 +433,6 @@ class Scheduler():
         # Set the class flag to stopped
         self.__running = 0
         
-        # Close the profile file
-        self.__fid.close()
-        
         # Tell the user we have stopped running
         print("finished!\n")
 
@@ -231,3 +489,96 @@ class Scheduler():
         
         # Return the run state
         return running
+
+
+# Sends profile setpoints early so that they land on time, for a loadbank
+# (or anything else) that takes a while to act on a command
+class Lookahead():
+    # Code to run when class is created
+    # apply(setpoint) sends a setpoint, latency() is the current link latency in seconds
+    # log(record) is optionally given [planned, sent, latency, error, setpoint] for each edge,
+    # times since the epoch in seconds
+    # The error is an estimate, sent + latency - planned, nothing is read back from the
+    # Loadbank. So it shows timer wake up and write time against the latency estimate,
+    # not how the real link varied, and with write-behind sent is when it was queued
+    def __init__(self, profile, apply, latency, log=None):
+        self.__profile = profile
+        self.__apply = apply
+        self.__latency = latency
+        self.__log = log
+        self.__lock = threading.RLock()
+        self.__timer = None
+        self.__armed_for = None  # Edge the timer is set for
+        self.__ahead_until = float('-inf')  # Already sent the setpoint for this edge
+        self.__applied = None
+        self.edges = collections.deque(maxlen=1000)  # Latest edge timings
+
+    # Method to call every loop with the profile setpoint in force now
+    def step(self, setpoint):
+        with self.__lock:
+            # Catch up if the setpoint in force was never sent, eg. at the start
+            if time.monotonic() >= self.__ahead_until and setpoint != self.__applied:
+                self._send(setpoint, None)
+
+            # Set a timer for the next edge
+            edge = self.__profile.next_change
+            if edge is None or edge == self.__armed_for or edge == float('-inf'):
+                return
+            self._cancel_timer()
+            upcoming = self.__profile.next_setpoint
+            if upcoming < 0:
+                return
+            delay = edge - self.__latency() - time.monotonic()
+            if delay <= 0:
+                return
+            self.__armed_for = edge
+            self.__timer = threading.Timer(delay, self._fire, (edge, upcoming))
+            self.__timer.daemon = True
+            self.__timer.start()
+
+    # Method run by the timer to send the next setpoint
+    def _fire(self, edge, setpoint):
+        with self.__lock:
+            if self.__armed_for != edge or self.__profile.state != 1:
+                return
+            self.__timer = None
+            self.__ahead_until = edge
+            try:
+                self._send(setpoint, edge)
+            except Exception as error:  # Nobody to pass it to on the timer thread
+                print("Lookahead: " + str(error))
+
+    # Method to send a setpoint and estimate when it arrived against when it should have
+    def _send(self, setpoint, edge):
+        self.__apply(setpoint)
+        self.__applied = setpoint
+        if edge is not None:
+            sent = time.monotonic()
+            latency = self.__latency()
+            epoch = time.time() - time.monotonic()
+            record = [epoch + edge, epoch + sent, latency, sent + latency - edge, setpoint]
+            self.edges.append(record)
+            if self.__log:
+                self.__log(record)
+
+    # Method to stop the timer
+    def _cancel_timer(self):
+        if self.__timer:
+            self.__timer.cancel()
+        self.__timer = None
+        self.__armed_for = None
+
+    # Method to call when the profile pauses or stops
+    def cancel(self):
+        with self.__lock:
+            self._cancel_timer()
+            self.__ahead_until = float('-inf')
+            self.__applied = None
+
+    # Method to describe the edge timing errors
+    def __str__(self):
+        errors = [record[3] for record in self.edges]
+        if not errors:
+            return "No profile edges sent early yet"
+        return ("{0} edges, estimated error mean {1:.2f}ms min {2:.2f}ms max {3:.2f}ms").format(
+            len(errors), 1000 * sum(errors) / len(errors), 1000 * min(errors), 1000 * max(errors))
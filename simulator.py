@@ -0,0 +1,272 @@
+#!/usr/bin/python3
+
+# TDi Loadbank Simulator
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Pretends to be a TDi Loadbank on the network so that loadbank.TdiLoadbank
+# and main.py can be run without the hardware, eg:
+#     python3 simulator.py --port 10001 --password fuelcell --latency 0.005
+#     python3 main.py --host 127.0.0.1 --verbose
+
+# Import libraries
+import argparse, math, queue, random, socket, socketserver, threading, time
+
+
+# Full scale current for each sensitivity range (see Loadbank manual)
+_RANGES = {1: 0.3, 2: 0.6, 3: 1.0, 4: 3.0, 5: 6.0, 6: 10.0, 7: 15.0, 8: 20.0, 9: 30.0}
+
+# Names the Loadbank uses for each mode
+_MODES = {"cv": "VOLTAGE", "ci": "CURRENT", "cp": "POWER"}
+
+
+# Electrical model of a fuel cell stack on the Loadbank
+class Model():
+    # Code to run when class is created
+    def __init__(self, ocv=30.0, resistance=0.5, noise=0.01):
+        self.ocv = ocv  # Open circuit voltage
+        self.resistance = resistance  # Internal resistance in ohms
+        self.noise = noise  # Measurement noise, fraction of reading
+        self.lock = threading.Lock()
+
+        # Loadbank settings, as they are at power on
+        self.load = False
+        self.range = 9
+        self.mode = "ci"
+        self.setpoints = {"cv": 0.0, "ci": 0.0, "cp": 0.0}
+        self.limits = {"vl": 35.0, "il": 30.0, "pl": 1000.0, "uv": 0.0}
+
+    # Method to solve the operating point, returns [volts, amps]
+    def solve(self):
+        ocv, r = self.ocv, self.resistance
+        if not self.load:
+            return ocv, 0.0
+
+        # Current the Loadbank tries to draw in each mode
+        setpoint = self.setpoints[self.mode]
+        if self.mode == "cv":
+            amps = (ocv - setpoint) / r if setpoint < ocv else 0.0
+        elif self.mode == "cp":
+            discriminant = ocv ** 2 - 4 * r * setpoint
+            amps = (ocv - math.sqrt(discriminant)) / (2 * r) if discriminant > 0 else ocv / (2 * r)
+        else:
+            amps = setpoint
+
+        # Respect the current, range, power and minimum voltage limits
+        amps = max(0.0, min(amps, self.limits["il"], _RANGES[self.range]))
+        while amps > 0 and amps * (ocv - amps * r) > self.limits["pl"]:
+            amps -= 0.001 * ocv / r
+        amps = max(0.0, min(amps, (ocv - self.limits["uv"]) / r))
+
+        return ocv - amps * r, amps
+
+    # Method to take a noisy measurement of a reading
+    def _measure(self, value):
+        return value * (1 + random.gauss(0, self.noise)) if value else 0.0
+
+    # Method to answer one command, returns the reply or None
+    def command(self, line):
+        words = line.strip().lower().split()
+        if not words:
+            return None
+        command = words[0]
+        query = command.endswith('?')
+        command = command.rstrip('?')
+        value = words[1] if len(words) > 1 else None
+
+        with self.lock:
+            # Queries
+            if query:
+                volts, amps = self.solve()
+                if command == "v":
+                    return "{0:.3f} volts".format(self._measure(volts))
+                elif command == "i":
+                    return "{0:.3f} amps".format(self._measure(amps))
+                elif command == "p":
+                    return "{0:.3f} watts".format(self._measure(volts * amps))
+                elif command == "load":
+                    return "load " + ("on" if self.load else "off")
+                elif command == "mode":
+                    return _MODES[self.mode]
+                elif command == "rng":
+                    return "RANGE " + str(self.range) + " " + str(_RANGES[self.range]) + " AMP"
+                elif command in ("cv", "ci", "cp"):
+                    unit = {"cv": "volts", "ci": "amps", "cp": "watts"}[command]
+                    return "{0:.3f} {1}".format(self.setpoints[command], unit)
+                elif command in self.limits:
+                    unit = {"vl": "volts", "uv": "volts", "il": "amps", "pl": "watts"}[command]
+                    return "{0:.3f} {1}".format(self.limits[command], unit)
+                return "?"
+
+            # Settings, no reply
+            try:
+                if command == "load":
+                    self.load = value == "on"
+                elif command == "mode" and value in _MODES:
+                    self.mode = value
+                elif command == "rng" and int(value) in _RANGES:
+                    self.range = int(value)
+                elif command in self.setpoints:
+                    self.setpoints[command] = float(value)
+                elif command in self.limits:
+                    self.limits[command] = float(value)
+            except (TypeError, ValueError):
+                pass
+            return None
+
+
+# Handler for one client connection
+class _Handler(socketserver.BaseRequestHandler):
+    # Method to serve the connection until the client leaves
+    def handle(self):
+        server = self.server
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        replies = queue.Queue()
+        self.__due = 0.0
+        self.__buf = b""
+
+        # Write replies from their own thread so that they can be delayed
+        writer = threading.Thread(target=self._writer, args=(sock, replies), daemon=True)
+        writer.start()
+
+        try:
+            # Ask for the password first if there is one
+            if server.password:
+                sock.sendall(b"Password ? ")
+                attempt = self._readline(sock, b"\n")
+                if attempt is None or attempt.strip() != server.password:
+                    return
+
+            # Then answer commands, each ends with a carriage return
+            while True:
+                line = self._readline(sock, b"\r")
+                if line is None:
+                    return
+                reply = server.model.command(line)
+                if reply is not None:
+                    self._reply(replies, reply)
+        finally:
+            replies.put(None)
+
+    # Method to read up to and including an ending, None when closed
+    def _readline(self, sock, ending):
+        while ending not in self.__buf:
+            data = sock.recv(4096)
+            if not data:
+                return None
+            self.__buf += data
+        line, self.__buf = self.__buf.split(ending, 1)
+        return line.decode('ascii', 'replace').strip('\r\n')
+
+    # Method to schedule a reply with the configured link behaviour
+    def _reply(self, replies, reply):
+        server = self.server
+
+        # Sometimes the reply never comes
+        if random.random() < server.drop:
+            return
+
+        # Sometimes there is rubbish on the line
+        data = (reply + "\r\n").encode('ascii')
+        if random.random() < server.garbage:
+            data = bytes(random.randrange(33, 127) for n in range(random.randint(1, 8))) + data
+
+        # Replies go out in order, each after the link latency
+        delay = max(0.0, server.latency + random.uniform(-server.jitter, server.jitter))
+        self.__due = max(self.__due, time.monotonic() + delay)
+        replies.put((self.__due, data))
+
+    # Method to send the replies when they are due
+    @staticmethod
+    def _writer(sock, replies):
+        while True:
+            item = replies.get()
+            if item is None:
+                return
+            due, data = item
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                sock.sendall(data)
+            except OSError:
+                return
+
+
+# Define class
+class Simulator(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    # Code to run when class is created, port 0 picks a free port
+    def __init__(self, HOST='127.0.0.1', PORT=10001, password='',
+                 latency=0.0, jitter=0.0, drop=0.0, garbage=0.0, model=None):
+        self.password = password
+        self.latency = latency  # Seconds before each reply
+        self.jitter = jitter  # +/- seconds added to the latency
+        self.drop = drop  # Probability a reply is lost
+        self.garbage = garbage  # Probability of rubbish before a reply
+        self.model = model or Model()
+        self.__thread = None
+        socketserver.ThreadingTCPServer.__init__(self, (HOST, PORT), _Handler)
+
+    # Method to run the simulator in the background
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+        return self.server_address
+
+    # Method to stop the simulator
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        return 1
+
+
+## Inspect user input arguments
+def _parse_commandline():
+    # Define the parser
+    parser = argparse.ArgumentParser(description='TDi Loadbank Simulator')
+
+    # Define aguments
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=10001, help='Port to listen on')
+    parser.add_argument('--password', type=str, default='fuelcell', help='Password, blank for none')
+    parser.add_argument('--latency', type=float, default=0.0, help='Reply latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Reply jitter in seconds')
+    parser.add_argument('--drop', type=float, default=0.0, help='Probability a reply is dropped')
+    parser.add_argument('--garbage', type=float, default=0.0, help='Probability of garbage bytes')
+    parser.add_argument('--ocv', type=float, default=30.0, help='Open circuit voltage')
+    parser.add_argument('--resistance', type=float, default=0.5, help='Internal resistance in ohms')
+
+    # Return what was argued
+    return parser.parse_args()
+
+
+## Main run function
+if __name__ == "__main__":
+    args = _parse_commandline()
+    simulator = Simulator(args.host, args.port, args.password, args.latency,
+                          args.jitter, args.drop, args.garbage,
+                          Model(args.ocv, args.resistance))
+    print("Simulated loadbank listening on " + args.host + ":" + str(args.port))
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        simulator.server_close()
@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+
+# Telemetry publish/subscribe for the TDi Loadbank Controller
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# TdiLoadbank.update() publishes each sample once, every subscriber gets a
+# copy in its own ring buffer. A full buffer throws away its oldest sample so
+# a slow subscriber never holds up the control loop, eg:
+#     bus = telemetry.Bus()
+#     load.telemetry = bus
+#     samples = bus.subscribe()
+#     sample = samples.get(timeout=1.0)   # {"time": ..., "voltage": ..., ...}
+#
+# Or from another programme, one JSON sample per line or datagram:
+#     python3 main.py --telemetry-port 10003 --telemetry-udp 127.0.0.1:10004
+#     nc localhost 10003
+
+# Import libraries
+import collections, json, socket, socketserver, threading
+
+
+# Define class
+class Subscription():
+    # Code to run when class is created, size is the most samples kept
+    def __init__(self, size=100):
+        self.__samples = collections.deque(maxlen=size)
+        self.__ready = threading.Condition()
+        self.__closed = False
+        self.dropped = 0  # Count of samples thrown away as the buffer was full
+
+    # Method to add a sample, never blocks for long
+    def put(self, sample):
+        with self.__ready:
+            if self.__closed:  # Nobody is reading, and dropped is already counted
+                return
+            if len(self.__samples) == self.__samples.maxlen:
+                self.dropped += 1
+            self.__samples.append(sample)
+            self.__ready.notify()
+
+    # Method to take the oldest sample, None on timeout or once closed
+    def get(self, timeout=None):
+        with self.__ready:
+            if not self.__samples and not self.__closed:
+                self.__ready.wait(timeout)
+            return self.__samples.popleft() if self.__samples else None
+
+    # Method to take every waiting sample
+    def drain(self):
+        with self.__ready:
+            samples = list(self.__samples)
+            self.__samples.clear()
+            return samples
+
+    # Method to wake anything waiting in get
+    def close(self):
+        with self.__ready:
+            self.__closed = True
+            self.__ready.notify_all()
+
+    # Property - How many samples are waiting?
+    @property
+    def depth(self):
+        return len(self.__samples)
+
+
+# Define class
+class Bus():
+    # Code to run when class is created
+    def __init__(self):
+        self.__subscriptions = ()  # Replaced rather than changed so publish needs no lock
+        self.__lock = threading.Lock()
+        self.__latest = None
+        self.published = 0  # Count of samples published
+        self.__dropped = 0  # Samples dropped by subscriptions since gone
+
+    # Method to send a sample to every subscriber
+    def publish(self, sample):
+        self.__latest = sample
+        self.published += 1
+        for subscription in self.__subscriptions:
+            subscription.put(sample)
+
+    # Method to start receiving samples
+    def subscribe(self, size=100):
+        subscription = Subscription(size)
+        with self.__lock:
+            self.__subscriptions += (subscription,)
+        return subscription
+
+    # Method to stop receiving samples
+    def unsubscribe(self, subscription):
+        subscription.close()  # Its dropped count can't change after this
+        with self.__lock:
+            if subscription in self.__subscriptions:
+                self.__subscriptions = tuple(s for s in self.__subscriptions if s is not subscription)
+                self.__dropped += subscription.dropped
+
+    # Property - The last sample published, None if there hasn't been one
+    @property
+    def latest(self):
+        return self.__latest
+
+    # Property - How many subscribers are there?
+    @property
+    def subscribers(self):
+        return len(self.__subscriptions)
+
+    # Property - Samples dropped across every subscriber there has been, only ever goes up
+    @property
+    def dropped(self):
+        with self.__lock:
+            return self.__dropped + sum(subscription.dropped for subscription in self.__subscriptions)
+
+
+# Define class
+class UdpPublisher():
+    # Code to run when class is created, sends each sample as a JSON datagram
+    def __init__(self, bus, HOST, PORT, size=100):
+        self.__bus = bus
+        self.__address = (HOST, PORT)
+        self.__subscription = bus.subscribe(size)
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__running = True
+        self.__thread = threading.Thread(target=self._run, name="telemetry-udp", daemon=True)
+        self.__thread.start()
+
+    # Method to send samples from the background thread
+    def _run(self):
+        while self.__running:
+            sample = self.__subscription.get(1.0)
+            if sample is None:
+                continue
+            try:
+                self.__sock.sendto(json.dumps(sample).encode('utf-8'), self.__address)
+            except OSError:
+                pass  # Nobody listening, carry on
+
+    # Method to stop sending
+    def stop(self):
+        self.__running = False
+        self.__bus.unsubscribe(self.__subscription)
+        self.__thread.join()
+        self.__sock.close()
+        return 1
+
+
+# Define class
+class _Handler(socketserver.BaseRequestHandler):
+    # Method to stream samples until the client leaves
+    def handle(self):
+        subscription = self.server.bus.subscribe(self.server.size)
+        try:
+            while self.server.running:
+                sample = subscription.get(1.0)
+                if sample is not None:
+                    self.request.sendall(json.dumps(sample).encode('utf-8') + b"\n")
+        except OSError:
+            pass  # Client went away
+        finally:
+            self.server.bus.unsubscribe(subscription)
+
+
+# Define class
+class TelemetryServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    # Code to run when class is created, localhost only by default
+    def __init__(self, bus, HOST='127.0.0.1', PORT=10003, size=100):
+        self.bus = bus
+        self.size = size  # Samples kept for each client
+        self.running = True
+        self.__thread = None
+        socketserver.ThreadingTCPServer.__init__(self, (HOST, PORT), _Handler)
+
+    # Method to serve in the background
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, name="telemetry", daemon=True)
+        self.__thread.start()
+        return self.server_address
+
+    # Method to stop serving
+    def stop(self):
+        self.running = False
+        self.shutdown()
+        self.server_close()
+        return 1
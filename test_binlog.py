@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+
+# Tests for the binary logfile, run with:
+#     python3 -m pytest -q
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Import libraries
+import io
+import pytest
+import binlog, datalogger
+
+
+# Records as main.py logs them, [epoch, duration, mode, setpoint, voltage, current, power, Wh, Ah]
+START = 1444000000.0
+RECORDS = [
+    [START + 0.5, 0.5, "1", "2.5", 30.0, 2.5, 75.0, 0.25, 0.0078125],
+    [START + 1.25, 1.25, "999", "999", 29.5, 0.0, 0.0, 0.5, 0.015625],  # No mode
+]
+
+
+# Function to log records in one format, returns the filename
+def _log(tmp_path, name, records, fmt):
+    filename = str(tmp_path / name)
+    log = datalogger.Datalogger(filename, fmt=fmt)
+    for record in records:
+        log.write(record)
+    log.close()
+    return filename
+
+
+def test_records_round_trip(tmp_path):
+    filename = _log(tmp_path, "log.bin", RECORDS, binlog.BinaryFormat(START))
+    records = list(binlog.records(filename))
+    assert len(records) == 2
+    assert records[0] == (START + 0.5, 1.0, 2.5, 30.0, 2.5, 75.0, 0.25, 0.0078125)
+    assert records[1][1:3] == (999.0, 999.0)  # No mode is logged as it is
+
+
+def test_to_tsv_matches_tsv_log(tmp_path):
+    binary = _log(tmp_path, "log.bin", RECORDS, binlog.BinaryFormat(START))
+    text = _log(tmp_path, "log.tsv", RECORDS, datalogger.TsvFormat())
+    converted = io.StringIO()
+    binlog.to_tsv(binary, converted)
+    with open(text) as fid:
+        assert converted.getvalue() == fid.read()
+
+
+def test_not_a_binary_log(tmp_path):
+    filename = str(tmp_path / "log.tsv")
+    with open(filename, 'w') as fid:
+        fid.write("1.0\t2.0\t\n")
+    with pytest.raises(ValueError):
+        list(binlog.records(filename))
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+
+# Tests for the energy and charge counters, run with:
+#     python3 -m pytest -q
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Import libraries
+import pytest
+import energy
+
+
+def test_trapezium_between_samples():
+    counter = energy.Energy()
+    counter.add(0.0, 1.0, 10.0)
+    counter.add(36.0, 3.0, 30.0)
+    assert counter.amp_hours == pytest.approx(0.02)
+    assert counter.watt_hours == pytest.approx(0.2)
+    assert counter.seconds == 36.0
+
+
+def test_gap_is_left_out():
+    counter = energy.Energy()
+    counter.add(0.0, 1.0, 10.0)
+    counter.add(36.0, 1.0, 10.0)
+    counter.interrupt()
+    counter.add(1000.0, 1.0, 10.0)
+    counter.add(1036.0, 1.0, 10.0)
+    assert counter.amp_hours == pytest.approx(0.02)
+    assert counter.seconds == 72.0
+    assert counter.gaps == 1
+
+
+def test_not_a_number_interrupts():
+    counter = energy.Energy()
+    counter.add(0.0, 1.0, 10.0)
+    counter.add(36.0, "UNKNOWN", 10.0)
+    counter.add(72.0, 1.0, 10.0)
+    assert counter.amp_hours == 0.0
+    assert counter.gaps == 1
+
+
+def test_reset():
+    counter = energy.Energy()
+    counter.add(0.0, 1.0, 10.0)
+    counter.add(36.0, 1.0, 10.0)
+    counter.reset()
+    assert counter.watt_hours == 0.0
+    assert counter.seconds == 0.0
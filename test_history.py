@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+
+# Tests for the recent sample history, run with:
+#     python3 -m pytest -q
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Import libraries
+import math
+import pytest
+
+numpy = pytest.importorskip("numpy")  # History needs numpy, main.py carries on without it
+import history
+
+
+def test_statistics_over_window():
+    recent = history.History(100)
+    for n in range(10):
+        recent.append(float(n), [n, 2.0 * n, 1.0, -1.0])
+    statistics = recent.statistics(4.5, now=9.0)
+    assert statistics["setpoint"]["min"] == 5.0
+    assert statistics["setpoint"]["max"] == 9.0
+    assert statistics["voltage"]["mean"] == pytest.approx(14.0)
+    assert statistics["setpoint"]["std"] == pytest.approx(math.sqrt(2.0))
+    assert statistics["power"]["rms"] == pytest.approx(1.0)
+
+
+def test_window_wraps_round():
+    recent = history.History(4)
+    for n in range(6):
+        recent.append(float(n), [n, 0, 0, 0])
+    times, values = recent.window(100.0, now=5.0)
+    assert list(times) == [2.0, 3.0, 4.0, 5.0]
+    assert list(values[0]) == [2.0, 3.0, 4.0, 5.0]
+    assert list(recent.window(2.5, now=5.0)[0]) == [3.0, 4.0, 5.0]
+    assert recent.samples == 4
+
+
+def test_not_a_number_left_out():
+    recent = history.History(10)
+    recent.append(0.0, [1.0, 1.0, 1.0, 1.0])
+    recent.append(1.0, [None, 3.0, 1.0, 1.0])
+    statistics = recent.statistics(10.0, now=1.0)
+    assert statistics["setpoint"]["mean"] == 1.0
+    assert statistics["voltage"]["mean"] == 2.0
+
+
+def test_empty_window():
+    recent = history.History(10)
+    assert recent.statistics(10.0, now=0.0) == {}
+    assert recent.describe(10.0, now=0.0) == "No samples in the last 10s"
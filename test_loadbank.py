@@ -0,0 +1,232 @@
+#!/usr/bin/python3
+
+# Tests for the TDi Loadbank client against the simulator, run with:
+#     python3 -m pytest -q
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Import libraries
+import random, threading, time
+import pytest
+import loadbank, simulator
+
+
+PASSWORD = "fuelcell"
+
+
+# A simulated loadbank that can be power cycled, keeping its port
+class Bench():
+    # Code to run when class is created
+    def __init__(self):
+        self.model = simulator.Model()
+        self.__simulator = simulator.Simulator(PORT=0, password=PASSWORD, model=self.model)
+        self.host, self.port = self.__simulator.start()
+
+    # Method to cut the power, nothing answers until power_on
+    def power_off(self):
+        self.__simulator.drop = 1.0
+        self.__simulator.stop()
+
+    # Method to turn it back on, model is what it comes back as, eg. a fresh simulator.Model()
+    def power_on(self, model):
+        self.model = model
+        self.__simulator = simulator.Simulator(PORT=self.port, password=PASSWORD, model=model)
+        self.__simulator.start()
+
+    # Method to stop the simulator
+    def stop(self):
+        self.__simulator.stop()
+
+
+@pytest.fixture
+def bench():
+    bench = Bench()
+    yield bench
+    bench.stop()
+
+
+@pytest.fixture
+def load(bench):
+    load = loadbank.TdiLoadbank(bench.host, bench.port, PASSWORD, reconnect_backoff=0.1)
+    assert load.connect()
+    yield load
+    load.write_behind = False
+    load._tn.close()
+
+
+# Function to run the loadbank until it has reconnected
+def _until_connected(load, attempts=50):
+    for attempt in range(attempts):
+        try:
+            load.update()
+            return
+        except loadbank.LoadbankError:
+            time.sleep(0.1)
+    pytest.fail("Did not reconnect")
+
+
+# Function to run the loadbank until it notices the link is down
+def _until_disconnected(load, attempts=50):
+    for attempt in range(attempts):
+        try:
+            load.update()
+        except loadbank.LoadbankDisconnected:
+            return
+        except loadbank.LoadbankError:
+            pass
+    pytest.fail("Did not notice the link was down")
+
+
+# Function to wait until the simulator has acted on everything sent, it answers in order
+def _settle(load):
+    assert load.flush_writes(5.0)
+    load._get(load._tn, "v")
+
+
+## Reply framing
+def test_reply_single_line():
+    reply = loadbank._Reply(b'volts')
+    assert not reply.feed(b'\r\n12.3')
+    assert reply.feed(b'4 volts\r\n')
+    assert reply.text == "12.34 volts"
+
+
+def test_reply_skips_stale_partial_line():
+    reply = loadbank._Reply(b'amps')
+    assert reply.feed(b'garbage\r1.5 amps')
+    assert reply.text == "1.5 amps"
+
+
+def test_reply_multiline_keeps_line_ends():
+    reply = loadbank._Reply(b'AMP', multiline=True)
+    assert not reply.feed(b'\rrange 4\r')
+    assert reply.feed(b'\r\n60 AMP')
+    assert reply.text == "range 4\r\r\n60 AMP"
+
+
+## Write-behind
+def test_write_behind_keeps_write_queued_while_sending(load, bench, monkeypatch):
+    # Hold the writer in the middle of sending the first value
+    sending, release = threading.Event(), threading.Event()
+    send = load._send
+    def held_send(tn, buf):
+        if buf.startswith("ci 1.00"):
+            sending.set()
+            release.wait(5.0)
+        return send(tn, buf)
+    monkeypatch.setattr(load, "_send", held_send)
+
+    load.write_behind = True
+    load.current_constant = "1.00"
+    assert sending.wait(5.0)
+    load.current_constant = "2.00"
+    release.set()
+
+    _settle(load)
+    assert bench.model.setpoints["ci"] == 2.0
+
+
+def test_write_behind_keeps_last_of_burst(load, bench):
+    # Writes land while the writer is sending, the last of each burst must arrive
+    load.write_behind = True
+    rng = random.Random(1)
+    for trial in range(50):
+        for n in range(20):
+            last = "{0:.2f}".format((trial * 20 + n) / 100)
+            load.current_constant = last
+            time.sleep(rng.uniform(0, 0.002))
+        _settle(load)
+        assert bench.model.setpoints["ci"] == float(last)
+
+
+def test_unchanged_setting_is_suppressed(load):
+    load.current_constant = "2.0"
+    suppressed = load.suppressed
+    load.current_constant = "2.00"
+    assert load.suppressed == suppressed + 1
+
+
+## Reconnect and replay
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_power_cycle_restores_settings(load, bench, write_behind):
+    load.setup([["mode", "CURRENT"], ["range", "4"], ["current_limit", "3.0"], ["voltage_minimum", "0.5"]])
+    load.write_behind = write_behind
+    load.current_constant = "1.25"
+    load.flush_writes()
+
+    # Comes back with its defaults
+    bench.power_off()
+    bench.power_on(simulator.Model())
+    _until_connected(load)
+    _settle(load)
+
+    model = bench.model
+    assert model.range == 4
+    assert model.limits["il"] == 3.0
+    assert model.limits["uv"] == 0.5
+    assert model.setpoints["ci"] == 1.25
+    assert model.mode == "ci"
+
+
+def test_power_cycle_reports_setting_not_taken(load, bench, capsys):
+    load.setup([["range", "4"]])
+
+    # Comes back ignoring the range
+    class Stuck(simulator.Model):
+        def command(self, line):
+            return None if line.startswith("rng ") else simulator.Model.command(self, line)
+
+    bench.power_off()
+    bench.power_on(Stuck())
+    _until_connected(load)
+    assert "did not take rng 4 after reconnecting" in capsys.readouterr().out
+
+
+def test_load_off_during_outage_is_delivered(load, bench):
+    load.load = True
+    assert bench.model.load
+
+    # Turned off while nothing is answering, the loadbank comes back still on
+    model = bench.model
+    bench.power_off()
+    _until_disconnected(load)
+    load.load = False
+    bench.power_on(model)
+    _until_connected(load)
+
+    assert not bench.model.load
+    assert load.load is False
+
+
+def test_load_on_is_not_replayed(load, bench, capsys):
+    load.load = True
+
+    # Comes back off, it must not turn itself on
+    bench.power_off()
+    bench.power_on(simulator.Model())
+    _until_connected(load)
+
+    assert not bench.model.load
+    assert "Loadbank:" in capsys.readouterr().out
+
+
+def test_stale_handle_after_reconnect(load):
+    # Something holding the old connection uses the new one
+    old = load._tn
+    load.reconnect()
+    assert loadbank._to_float(load._get(old, "v")) is not None
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+# Tests for the telemetry bus, run with:
+#     python3 -m pytest -q
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Import libraries
+import telemetry
+
+
+def test_subscription_drops_oldest():
+    bus = telemetry.Bus()
+    subscription = bus.subscribe(2)
+    for n in range(5):
+        bus.publish(n)
+    assert subscription.drain() == [3, 4]
+    assert bus.latest == 4
+    assert bus.published == 5
+
+
+def test_dropped_counts_subscribers_gone():
+    bus = telemetry.Bus()
+    first, second = bus.subscribe(2), bus.subscribe(4)
+    for n in range(5):
+        bus.publish(n)
+    assert bus.dropped == 4
+    bus.unsubscribe(first)
+    assert bus.dropped == 4
+    bus.unsubscribe(first)
+    bus.publish(5)
+    assert bus.dropped == 5
+    assert bus.subscribers == 1
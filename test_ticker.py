@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+
+# Tests for the fixed rate ticker, run with:
+#     python3 -m pytest -q
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Import libraries
+import pytest
+import ticker
+
+
+# A clock that only moves when slept on, or by hand
+class Clock():
+    # Code to run when class is created
+    def __init__(self):
+        self.now = 0.0
+
+    # Method to read the clock
+    def __call__(self):
+        return self.now
+
+    # Method to stand in for time.sleep
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ticker.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_ticks_on_time(clock):
+    tick = ticker.Ticker(10, clock=clock)
+    assert tick.wait() == 0.0
+    for n in range(5):
+        assert tick.wait() == pytest.approx(0.0)
+    assert clock.now == pytest.approx(0.5)
+    assert tick.ticks == 6
+    assert tick.overruns == 0
+
+
+def test_skip_drops_missed_ticks(clock):
+    tick = ticker.Ticker(1, policy=ticker.SKIP, clock=clock)
+    tick.wait()
+    clock.now = 3.5  # The tick due at 1 ran long
+    assert tick.wait() == pytest.approx(0.0)
+    assert clock.now == pytest.approx(4.0)
+    assert tick.overruns == 1
+    assert tick.skipped == 3
+
+
+def test_catch_up_goes_straight_away(clock):
+    tick = ticker.Ticker(1, policy=ticker.CATCH_UP, clock=clock)
+    tick.wait()
+    clock.now = 2.5
+    assert tick.wait() == pytest.approx(1.5)
+    assert tick.wait() == pytest.approx(0.5)
+    assert tick.wait() == pytest.approx(0.0)
+    assert clock.now == pytest.approx(3.0)
+    assert tick.skipped == 0
+
+
+def test_wakes_early(clock):
+    tick = ticker.Ticker(1, clock=clock)
+    tick.wait()
+    assert tick.wait(early=0.25) is None
+    assert clock.now == pytest.approx(0.25)
+    assert tick.wait() == pytest.approx(0.0)
+    assert clock.now == pytest.approx(1.0)
+    assert tick.early == 1
+
+
+def test_bad_arguments():
+    with pytest.raises(ValueError):
+        ticker.Ticker(0)
+    with pytest.raises(ValueError):
+        ticker.Ticker(1, policy="sometimes")
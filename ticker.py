@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+
+# Fixed rate tick engine for the TDi Loadbank Controller main loop
+
+# Copyright (C) 2015  Simon Howroyd
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#############################################################################
+
+# Import libraries
+import time
+
+
+# What to do after a tick overruns its period
+SKIP     = "skip"      # Drop the missed ticks and carry on from the next one due
+CATCH_UP = "catch-up"  # Run the missed ticks back to back until back on time
+
+
+# Define class
+class Ticker():
+    # Code to run when class is created, rate in Hz
+    def __init__(self, rate, policy=SKIP, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("Tick rate must be positive")
+        if policy not in (SKIP, CATCH_UP):
+            raise ValueError("Unknown overrun policy " + str(policy))
+
+        # Define internal variables
+        self.__period = 1.0 / rate
+        self.__policy = policy
+        self.__clock = clock
+        self.__start = None
+        self.__tick = 0
+        self.__ticks = 0
+        self.__overruns = 0
+        self.__skipped = 0
+        self.__early = 0
+        self.__jitter_last = 0.0
+        self.__jitter_max = 0.0
+        self.__jitter_total = 0.0
+
+    # Method to wait for the next tick, returns how late we woke up in seconds
+    # Deadlines are counted from the start so errors never add up
+    # If early is a time before the next tick, wake then instead and return None
+    def wait(self, early=None):
+        now = self.__clock()
+
+        # The first tick is now
+        if self.__start is None:
+            self.__start = now
+            self.__ticks = 1
+            return 0.0
+
+        deadline = self.__start + (self.__tick + 1) * self.__period
+
+        # Something needs doing before the next tick
+        if early is not None and early < deadline:
+            while now < early:
+                time.sleep(early - now)
+                now = self.__clock()
+            self.__early += 1
+            return None
+
+        self.__tick += 1
+
+        # Already late, the last tick took longer than its period
+        if now > deadline:
+            self.__overruns += 1
+            if self.__policy == SKIP:
+                # Move on to the next tick still to come
+                missed = int((now - deadline) / self.__period) + 1
+                self.__tick += missed
+                self.__skipped += missed
+                deadline = self.__start + self.__tick * self.__period
+            else:
+                # Go straight away
+                return self._record(now - deadline)
+
+        # Sleep until the deadline
+        while now < deadline:
+            time.sleep(deadline - now)
+            now = self.__clock()
+
+        return self._record(now - deadline)
+
+    # Method to keep the jitter statistics
+    def _record(self, late):
+        self.__ticks += 1
+        self.__jitter_last = late
+        self.__jitter_max = max(self.__jitter_max, late)
+        self.__jitter_total += late
+        return late
+
+    # Property - Seconds between ticks
+    @property
+    def period(self):
+        return self.__period
+
+    # Property - How many ticks have run?
+    @property
+    def ticks(self):
+        return self.__ticks
+
+    # Property - How many ticks took longer than their period?
+    @property
+    def overruns(self):
+        return self.__overruns
+
+    # Property - How many ticks were dropped by the skip policy?
+    @property
+    def skipped(self):
+        return self.__skipped
+
+    # Property - How many times did we wake early between ticks?
+    @property
+    def early(self):
+        return self.__early
+
+    # Property - How late was the last tick?
+    @property
+    def jitter(self):
+        return self.__jitter_last
+
+    # Property - Latest any tick has been
+    @property
+    def jitter_max(self):
+        return self.__jitter_max
+
+    # Property - Average lateness of the ticks
+    @property
+    def jitter_mean(self):
+        return self.__jitter_total / (self.__ticks - 1) if self.__ticks > 1 else 0.0
+
+    # Method to describe the statistics
+    def __str__(self):
+        return ("{0} ticks at {1:.1f}Hz, {2} overruns, {3} skipped, {4} early, "
+                "jitter mean {5:.2f}ms max {6:.2f}ms").format(
+                    self.ticks, 1.0 / self.__period, self.__overruns, self.__skipped,
+                    self.__early, 1000 * self.jitter_mean, 1000 * self.__jitter_max)